@@ -1,87 +1,135 @@
 # app.py (גרסה מתוקנת ושלמה)
 import sys
-import json
-import csv
 import os
-from collections import defaultdict
-from flask import Flask, request, jsonify, render_template
+import io
+import csv
+import json
+import gzip
+import time
+import hashlib
+import threading
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+from lookup_tables import SOURCE_FILES, SNAPSHOT_FILE
+from deltas import DeltaError, list_delta_files, DELTA_DIR
+from device_index import (DeviceIndex, format_batch_line, format_ndjson_row, format_ndjson_summary,
+                          batch_json_payload, csv_header, csv_fields)
+from result_cache import ResultCache
+from metrics import Registry
+from profiler import SlowRequestProfiler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # --- הגדרת משתנים גלובליים ---
-canonical_name_to_internal_models = defaultdict(set)
-internal_model_to_canonical_names = defaultdict(set)
-search_aliases = {}
-all_suggestions = set()
+# כל הטבלאות והאינדקסים מוחזקים באובייקט DeviceIndex אחד (device_index.py). טעינה מחדש בונה אובייקט חדש
+# ומחליפה אותו בהשמה אחת, כך שבקשה שרצה תמיד רואה סט טבלאות שלם.
+tables = None
+_reload_lock = threading.Lock()
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# "dict" טוען את הטבלאות לזיכרון של כל worker, "mmap" ממפה את קובץ ה-snapshot ומשתף אותו בין ה-workers
+STORE_BACKEND = os.environ.get('DEVICE_MAPPING_STORE', 'dict')
+
+# גבולות למספר ההצעות שנקודת הקצה /suggest מחזירה
+DEFAULT_SUGGEST_LIMIT = 20
+MAX_SUGGEST_LIMIT = 100
+
+# גודל עמוד ברירת המחדל והמקסימלי בנקודות הקצה /manufacturer ו-/models
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+# מספר השורות בכל chunk בתגובה זורמת, ומספר השורות המקסימלי בבקשת batch אחת (0 = ללא הגבלה)
+BATCH_STREAM_CHUNK = 500
+MAX_BATCH_LINES = int(os.environ.get('DEVICE_MAPPING_MAX_BATCH_LINES', 1_000_000))
+
+# טעינה מחדש: טוקן לנקודת הקצה /admin/reload (ריק = כבויה), מרווח בדיקת הקבצים בשניות (0 = כבוי),
+# והחלק המינימלי של הכינויים שטעינה חדשה חייבת לשמור כדי לעבור ולידציה
+ADMIN_TOKEN = os.environ.get('DEVICE_MAPPING_ADMIN_TOKEN', '')
+WATCH_INTERVAL = float(os.environ.get('DEVICE_MAPPING_WATCH_INTERVAL', 0))
+RELOAD_MIN_ALIAS_RATIO = 0.5
+
+# מטמון תגובות: מספר התגובות השמורות ל-/lookup ו-/suggest, ומספר וגודל כולל (בבתים) לעמודי /manufacturer
+# ו-/models ול-/batch_lookup. כל המטמונים קשורים לגרסת הנתונים ומתרוקנים כשהטבלאות משתנות.
+LOOKUP_CACHE_SIZE = 20_000
+PAGE_CACHE_SIZE = 1_000
+PAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+BATCH_CACHE_SIZE = 64
+BATCH_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# כמה שניות דפדפן או CDN יכולים להשתמש בתגובת GET לפני שהם בודקים אותה שוב מול ה-ETag
+CACHE_MAX_AGE = int(os.environ.get('DEVICE_MAPPING_CACHE_MAX_AGE', 60))
+
+lookup_cache = ResultCache(LOOKUP_CACHE_SIZE)
+page_cache = ResultCache(PAGE_CACHE_SIZE, PAGE_CACHE_MAX_BYTES)
+batch_cache = ResultCache(BATCH_CACHE_SIZE, BATCH_CACHE_MAX_BYTES)
+# (data_version, {content_encoding: body}) של רשימת ההצעות המלאה, נבנה פעם אחת לכל גרסה
+_suggestions_payload = (None, {})
+
+# פרופיילר דגימה לבקשות איטיות: בקשה שרצה יותר מ-PROFILE_SLOW_MS מילישניות נדגמת, והמחסניות שלה נכתבות
+# לתיקייה PROFILE_DIR (0 = כבוי)
+PROFILE_SLOW_MS = float(os.environ.get('DEVICE_MAPPING_PROFILE_SLOW_MS', 0))
+PROFILE_DIR = os.environ.get('DEVICE_MAPPING_PROFILE_DIR', os.path.join(BASE_PATH, 'profiles'))
+slow_request_profiler = SlowRequestProfiler(PROFILE_SLOW_MS, PROFILE_DIR) if PROFILE_SLOW_MS > 0 else None
+
+# --- מדדים (נחשפים ב-/metrics בפורמט Prometheus) ---
+metrics = Registry()
+REQUESTS = metrics.counter('device_mapping_requests_total', 'HTTP requests by route, method and status.',
+                           ('route', 'method', 'status'))
+REQUEST_SECONDS = metrics.histogram('device_mapping_request_seconds',
+                                    'HTTP request latency in seconds, including streamed bodies.', ('route',))
+LOOKUP_RESULTS = metrics.counter('device_mapping_lookup_results_total',
+                                 'Single lookups by search type and result status.', ('type', 'status'))
+BATCH_LINES = metrics.histogram('device_mapping_batch_lines', 'Lines per batch lookup.',
+                                buckets=(1, 10, 100, 1_000, 10_000, 100_000, 1_000_000))
+BATCH_ITEM_SECONDS = metrics.histogram('device_mapping_batch_item_seconds',
+                                       'Average resolution time per line of a batch lookup, in seconds.',
+                                       buckets=(1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 1e-3, 1e-2))
+LOAD_SECONDS = metrics.gauge('device_mapping_load_seconds', 'Duration of the last successful table update.',
+                             ('kind',))
+TABLE_UPDATES = metrics.counter('device_mapping_table_updates_total', 'Table loads, reloads and delta updates.',
+                                ('kind', 'result'))
+metrics.gauge('device_mapping_search_aliases', 'Aliases in the live tables.',
+              function=lambda: len(tables.search_aliases))
+metrics.gauge('device_mapping_suggestions', 'Suggestions in the live tables.',
+              function=lambda: len(tables.all_suggestions))
+metrics.gauge('device_mapping_cache_entries', 'Entries held by each response cache.', ('cache',),
+              function=lambda: {(name, ): len(cache) for name, cache in _caches().items()})
+metrics.counter('device_mapping_cache_hits_total', 'Cache hits by cache.', ('cache',),
+                function=lambda: {(name, ): cache.hits for name, cache in _caches().items()})
+metrics.counter('device_mapping_cache_misses_total', 'Cache misses by cache.', ('cache',),
+                function=lambda: {(name, ): cache.misses for name, cache in _caches().items()})
+
+
+def _caches():
+    # מטמון ה-fuzzy שייך לאובייקט הטבלאות ומתחלף איתו בטעינה מחדש
+    return {'lookup': lookup_cache, 'page': page_cache, 'batch': batch_cache, 'fuzzy': tables.fuzzy_cache}
+
+
+def _validate_tables(new_tables, current_tables):
+    """Raises ValueError if freshly built tables look broken compared with the ones being served."""
+    if not new_tables.search_aliases or not new_tables.canonical_name_to_internal_models or \
+            not new_tables.internal_model_to_canonical_names:
+        raise ValueError("New tables are empty.")
+    if current_tables is not None:
+        minimum = int(len(current_tables.search_aliases) * RELOAD_MIN_ALIAS_RATIO)
+        if len(new_tables.search_aliases) < minimum:
+            raise ValueError(f"New tables have {len(new_tables.search_aliases)} aliases, "
+                             f"fewer than the required {minimum}.")
 
 
 # === קוד מתוקן ושלם לפונקציית טעינת הנתונים ===
 def load_data():
     """Loads and processes data from text files."""
-    global all_suggestions
-
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    mapping_devices_path = os.path.join(base_path, 'mapping_devices.txt')
-    device_names_path = os.path.join(base_path, 'device_names.txt')
-    ios_device_mapping_path = os.path.join(base_path, 'mapping_ios_devices.txt')
+    global tables
 
     try:
-        # Step 1: Process mapping_devices.txt (Android)
-        with open(mapping_devices_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        for entry in data:
-            manufacturer = entry[0].strip()
-            canonical_device_name = entry[1].strip()
-            search_aliases[canonical_device_name.lower()] = ("name", canonical_device_name)
-            combined_name_by_manufacturer = f"{manufacturer} {canonical_device_name}".strip()
-            if combined_name_by_manufacturer.lower() != canonical_device_name.lower():
-                search_aliases[combined_name_by_manufacturer.lower()] = ("name", canonical_device_name)
-            if len(entry) > 2 and entry[2]:
-                alias_from_entry2 = entry[2].strip()
-                if alias_from_entry2 and alias_from_entry2.lower() != canonical_device_name.lower() and \
-                        search_aliases.get(alias_from_entry2.lower(), (None, None))[
-                            0] != "model" and alias_from_entry2.lower() != combined_name_by_manufacturer.lower():
-                    search_aliases[alias_from_entry2.lower()] = ("name", canonical_device_name)
-            specific_internal_models = [m.strip() for m in entry[3:] if m.strip()] if len(entry) > 3 else []
-            canonical_name_to_internal_models[canonical_device_name].update(specific_internal_models)
-            for model_code in specific_internal_models:
-                internal_model_to_canonical_names[model_code].add(canonical_device_name)
-                search_aliases[model_code.lower()] = ("model", model_code)
-
-        # Step 2: Process device_names.txt
-        with open(device_names_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter='\t')
-            next(reader)
-            for row in reader:
-                if len(row) >= 2:
-                    make_from_file = row[0].strip()
-                    device_name_from_file = row[1].strip()
-                    if search_aliases.get(device_name_from_file.lower(), (None, None))[0] != "model":
-                        search_aliases[device_name_from_file.lower()] = ("name", device_name_from_file)
-                    combined_alias = f"{make_from_file} {device_name_from_file}".strip()
-                    if search_aliases.get(combined_alias.lower(), (None, None))[0] != "model":
-                        search_aliases[combined_alias.lower()] = ("name", combined_alias)
-
-        # Step 3: Process mapping_ios_devices.txt
-        with open(ios_device_mapping_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or ':' not in line or line.startswith('device_model'):
-                    continue
-                parts = line.split(':', 1)
-                ios_model, ios_name = parts[0].strip(), parts[1].strip()
-                if not ios_model or not ios_name:
-                    continue
-                canonical_name_to_internal_models[ios_name].add(ios_model)
-                internal_model_to_canonical_names[ios_model].add(ios_name)
-                if search_aliases.get(ios_name.lower(), (None, None))[0] != "model":
-                    search_aliases[ios_name.lower()] = ("name", ios_name)
-                search_aliases[ios_model.lower()] = ("model", ios_model)
-
-        # Step 4: Populate suggestions for autocomplete
-        for key_type, original_key in search_aliases.values():
-            all_suggestions.add(original_key)
-
-        print(f"Data loaded successfully! Found {len(all_suggestions)} suggestions.")
+        started = time.perf_counter()
+        tables = DeviceIndex.load(BASE_PATH, STORE_BACKEND)
+        LOAD_SECONDS.set(time.perf_counter() - started, 'load')
+        TABLE_UPDATES.inc('load', 'success')
+        print(f"Data loaded successfully! Found {len(tables.all_suggestions)} suggestions.")
     except FileNotFoundError as e:
         print(f"FATAL ERROR: Data file not found: {e}. Make sure all .txt files are in the same directory as app.py.")
         sys.exit(1)
@@ -90,41 +138,298 @@ def load_data():
         sys.exit(1)
 
 
+def reload_data():
+    """
+    Builds a new set of tables next to the live one and swaps it in with a single assignment.
+    If loading or validation fails the current tables stay in place.
+    Returns (ok, message).
+    """
+    global tables
+
+    with _reload_lock:
+        started = time.perf_counter()
+        try:
+            new_tables = DeviceIndex.load(BASE_PATH, STORE_BACKEND)
+            _validate_tables(new_tables, tables)
+        except Exception as e:
+            TABLE_UPDATES.inc('reload', 'error')
+            message = f"Reload failed, keeping the current tables: {e}"
+            print(message)
+            return False, message
+        tables = new_tables
+        LOAD_SECONDS.set(time.perf_counter() - started, 'reload')
+        TABLE_UPDATES.inc('reload', 'success')
+    message = f"Data reloaded successfully! Found {len(new_tables.all_suggestions)} suggestions."
+    print(message)
+    return True, message
+
+
+def apply_pending_deltas():
+    """
+    Applies the delta lines appended since the last load to the live tables in place.
+    Falls back to a full reload when the tables are read-only (mmap) or a delta file was
+    rewritten rather than appended to. Returns (ok, message).
+    """
+    with _reload_lock:
+        current_tables = tables
+        if not current_tables.read_only:
+            started = time.perf_counter()
+            try:
+                ops, changes = current_tables.apply_pending_deltas()
+            except DeltaError as e:
+                print(f"Delta files can't be applied incrementally ({e}); reloading everything.")
+            else:
+                LOAD_SECONDS.set(time.perf_counter() - started, 'deltas')
+                TABLE_UPDATES.inc('deltas', 'success')
+                message = f"Applied {len(ops)} delta operations ({len(changes)} alias changes)."
+                print(message)
+                return True, message
+    return reload_data()
+
+
+def _file_signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            signature.append((path, None, None))
+    return signature
+
+
+def _data_files_signature():
+    """
+    Size and mtime of every data file (and the snapshot), then of every delta file,
+    used by the file watcher.
+    """
+    data_paths = [os.path.join(BASE_PATH, filename) for filename in SOURCE_FILES + (SNAPSHOT_FILE,)]
+    delta_paths = [os.path.join(BASE_PATH, DELTA_DIR, filename) for filename in list_delta_files(BASE_PATH)]
+    return _file_signature(data_paths), _file_signature(delta_paths)
+
+
+def _watch_data_files(interval, last_signature):
+    """
+    Polls the data files and reloads once a change has been stable for one interval.
+    When only delta files changed, the new delta lines are applied without a reload.
+    """
+    while True:
+        time.sleep(interval)
+        # שגיאה בסבב אחד נרשמת ולא עוצרת את ה-watcher, שממשיך לזהות את השינויים הבאים
+        try:
+            signature = _data_files_signature()
+            if signature == last_signature:
+                continue
+            # Wait for the writer to finish before reading half-written files.
+            time.sleep(interval)
+            if _data_files_signature() != signature:
+                continue
+            deltas_only = signature[0] == last_signature[0]
+            last_signature = signature
+            if deltas_only:
+                apply_pending_deltas()
+            else:
+                reload_data()
+        except Exception as e:
+            print(f"Data file watcher error, keeping the current tables: {e}")
+
+
+def start_data_watcher(interval=WATCH_INTERVAL):
+    """Starts the background file watcher thread if interval is positive."""
+    if interval <= 0:
+        return None
+    watcher = threading.Thread(target=_watch_data_files, args=(interval, _data_files_signature()),
+                               name='data-file-watcher', daemon=True)
+    watcher.start()
+    return watcher
+
+
 def _perform_single_lookup_logic(query_text, search_type):
-    normalized_query = query_text.strip().lower()
-    if not normalized_query:
-        return "error", [], "Empty query."
-    lookup_result = search_aliases.get(normalized_query)
-    if lookup_result:
-        lookup_alias_type, canonical_key_string = lookup_result
-        if search_type == "model":
-            if lookup_alias_type == "name":
-                models = canonical_name_to_internal_models.get(canonical_key_string)
-                if models:
-                    return "success", sorted(list(models)), f"Models for '{canonical_key_string}':"
-                else:
-                    return "not_found", [], f"No internal models found for '{canonical_key_string}'."
-            elif lookup_alias_type == "model":
-                return "info", [], f"'{query_text}' is an internal model. Use 'Search Name' to find its name(s)."
-        elif search_type == "name":
-            if lookup_alias_type == "model":
-                names = internal_model_to_canonical_names.get(canonical_key_string)
-                if names:
-                    return "success", sorted(list(names)), f"Names for internal model '{canonical_key_string}':"
-                else:
-                    return "not_found", [], f"No device names found for internal model '{canonical_key_string}'."
-            elif lookup_alias_type == "name":
-                return "info", [], f"'{query_text}' is a device name. Use 'Search Model' to find its internal model(s)."
-    return "not_found", [], f"No direct match found for '{query_text}'."
+    return tables.lookup(query_text, search_type)
+
+
+class BatchTooLarge(ValueError):
+    """A streamed text/plain batch has more than MAX_BATCH_LINES queries."""
+
+
+def _text_queries(stream):
+    """The lines of a text/plain batch body as they arrive; raises BatchTooLarge past MAX_BATCH_LINES queries."""
+    count = 0
+    for raw_line in stream:
+        line = raw_line.decode('utf-8', 'replace')
+        if line.strip():
+            count += 1
+            if MAX_BATCH_LINES and count > MAX_BATCH_LINES:
+                raise BatchTooLarge(f'Too many queries: at most {MAX_BATCH_LINES} per batch.')
+        yield line
+
+
+def _iter_batch_results(queries, found_models, found_names, fuzzy=False):
+    # כל ה-batch נפתר מול הטבלאות שהיו פעילות כשהוא התחיל
+    return _observed_batch(tables.iter_batch(queries, found_models, found_names, fuzzy))
+
+
+def observe_batch(lines, seconds):
+    """Records the size of a finished batch and its average resolution time per line."""
+    if lines:
+        BATCH_LINES.observe(lines)
+        BATCH_ITEM_SECONDS.observe(seconds / lines)
+
+
+def _observed_batch(results):
+    # סופר רק את הזמן שבו השורות נפתרות, לא את הזמן שבו תגובה זורמת ממתינה ללקוח
+    lines, seconds = 0, 0.0
+    clock = time.perf_counter
+    results = iter(results)
+    try:
+        while True:
+            started = clock()
+            try:
+                result = next(results)
+            except StopIteration:
+                return
+            seconds += clock() - started
+            lines += 1
+            yield result
+    finally:
+        observe_batch(lines, seconds)
+
+
+def _with_cache_headers(response, version):
+    response.set_etag(version, weak=True)
+    response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}'
+    return response
+
+
+def _not_modified(version):
+    """Returns a 304 response if the client already holds this data version, otherwise None."""
+    if request.if_none_match.contains_weak(version):
+        return _with_cache_headers(Response(status=304), version)
+    return None
+
+
+def _json_response(body, version=None):
+    response = Response(body, mimetype='application/json')
+    return _with_cache_headers(response, version) if version is not None else response
+
+
+def _encoded_suggestions(current_tables):
+    """The full suggestion list as JSON, plain and pre-compressed, built once per data version."""
+    global _suggestions_payload
+    version, bodies = _suggestions_payload
+    if version != current_tables.data_version:
+        body = jsonify(sorted(list(current_tables.all_suggestions))).get_data()
+        bodies = {'identity': body, 'gzip': gzip.compress(body, 9)}
+        if brotli is not None:
+            bodies['br'] = brotli.compress(body)
+        _suggestions_payload = (current_tables.data_version, bodies)
+    return bodies
+
+
+def _stream_batch_ndjson(queries, fuzzy):
+    found_models, found_names = set(), set()
+    chunk = []
+    try:
+        for result in _iter_batch_results(queries, found_models, found_names, fuzzy):
+            chunk.append(format_ndjson_row(*result))
+            if len(chunk) >= BATCH_STREAM_CHUNK:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+    except BatchTooLarge as e:
+        # הסטטוס 200 כבר נשלח, ולכן הזרם מסתיים בשורת שגיאה במקום שורת הסיכום
+        chunk.append(json.dumps({'error': str(e)}))
+        yield "\n".join(chunk) + "\n"
+        return
+    chunk.append(format_ndjson_summary(found_models, found_names))
+    yield "\n".join(chunk) + "\n"
+
+
+def _manufacturer_item(current_tables, name):
+    return {'name': name, 'models': sorted(current_tables.canonical_name_to_internal_models.get(name) or ())}
+
+
+def _model_item(current_tables, model):
+    return {'model': model, 'names': sorted(current_tables.internal_model_to_canonical_names.get(model) or ())}
+
+
+def _page_args():
+    """offset ו-limit מהבקשה. ב-ndjson אין גבול ברירת מחדל, כדי שהזרם יכיל את כל התוצאות."""
+    offset = max(0, request.args.get('offset', 0, type=int))
+    if request.args.get('format') == 'ndjson':
+        limit = request.args.get('limit', type=int)
+        return offset, None if limit is None else max(0, limit)
+    limit = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+    return offset, max(1, min(limit, MAX_PAGE_LIMIT))
+
+
+def _expansion_response(current_tables, version, fields, total, keys, make_item, offset, limit):
+    """עמוד JSON עם total/next_offset, או זרם ndjson של פריט אחד בכל שורה."""
+    if request.args.get('format') == 'ndjson':
+        def rows():
+            for start in range(0, len(keys), BATCH_STREAM_CHUNK):
+                chunk = keys[start:start + BATCH_STREAM_CHUNK]
+                yield "".join(json.dumps(make_item(current_tables, key)) + "\n" for key in chunk)
+        response = Response(stream_with_context(rows()), mimetype='application/x-ndjson')
+        return _with_cache_headers(response, version)
+    next_offset = offset + limit if offset + limit < total else None
+    body = dict(fields, total=total, offset=offset, limit=limit, next_offset=next_offset,
+                items=[make_item(current_tables, key) for key in keys])
+    return _json_response(jsonify(body).get_data(), version)
+
+
+def _stream_batch_csv(queries, fuzzy):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(csv_header(fuzzy))
+    rows = 0
+    try:
+        for result in _iter_batch_results(queries, set(), set(), fuzzy):
+            writer.writerow(csv_fields(*result, fuzzy))
+            rows += 1
+            if rows % BATCH_STREAM_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    except BatchTooLarge as e:
+        writer.writerow(['', 'error', str(e)])
+    yield buffer.getvalue()
 
 
 # --- הגדרת אפליקציית Flask ונקודות הקצה (Endpoints) ---
 # (ללא שינוי מהגרסה הקודמת)
 
 load_data()
+start_data_watcher()
 app = Flask(__name__)
 
 
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    if slow_request_profiler is not None:
+        g.profile_token = slow_request_profiler.begin(f"{request.method} {request.path}")
+
+
+@app.after_request
+def _record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(error=None):
+    # teardown רץ אחרי שתגובה זורמת הסתיימה, ולכן הזמן כולל את כל גוף התגובה
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+    REQUESTS.inc(route, request.method, str(g.pop('response_status', 500)))
+    token = g.pop('profile_token', None)
+    if token is not None:
+        slow_request_profiler.end(token)
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -132,50 +437,205 @@ def index():
 
 @app.route('/lookup', methods=['GET'])
 def lookup():
+    current_tables = tables
+    version = current_tables.data_version
+    not_modified = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
     query = request.args.get('query', '')
     search_type = request.args.get('type', 'model')
-    status, items, message = _perform_single_lookup_logic(query, search_type)
-    return jsonify({'status': status, 'items': items, 'message': message})
+    fuzzy = request.args.get('fuzzy') in ('1', 'true')
+    # ההודעה מצטטת את השאילתה כפי שנכתבה, ולכן המפתח הוא השאילתה המקורית
+    cache_key = ('lookup', query, search_type, fuzzy)
+    # נשמר יחד עם הסטטוס, כדי שגם תשובות מהמטמון ייספרו במדדי התוצאות
+    cached = lookup_cache.get(version, cache_key)
+    if cached is None:
+        status, items, message = current_tables.lookup(query, search_type)
+        response = {'status': status, 'items': items, 'message': message}
+        if fuzzy and status == "not_found":
+            if current_tables.find_alias(query) is None:
+                response['candidates'] = current_tables.fuzzy_candidates(query)
+        cached = (status, jsonify(response).get_data())
+        lookup_cache.put(version, cache_key, cached)
+    status, body = cached
+    LOOKUP_RESULTS.inc(search_type if search_type in ('model', 'name') else 'other', status)
+    return _json_response(body, version)
 
 
 @app.route('/suggestions')
 def suggestions():
-    return jsonify(sorted(list(all_suggestions)))
+    current_tables = tables
+    version = current_tables.data_version
+    not_modified = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
+    bodies = _encoded_suggestions(current_tables)
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in bodies and request.accept_encodings.quality(candidate) > 0:
+            encoding = candidate
+            break
+    response = _json_response(bodies[encoding], version)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.route('/suggest')
+def suggest():
+    current_tables = tables
+    version = current_tables.data_version
+    not_modified = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', DEFAULT_SUGGEST_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_SUGGEST_LIMIT))
+    cache_key = ('suggest', query.strip().lower(), limit)
+    body = lookup_cache.get(version, cache_key)
+    if body is None:
+        body = jsonify(current_tables.suggest(query, limit)).get_data()
+        lookup_cache.put(version, cache_key, body)
+    return _json_response(body, version)
+
+
+@app.route('/manufacturers')
+def manufacturers():
+    current_tables = tables
+    version = current_tables.data_version
+    not_modified = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
+    body = lookup_cache.get(version, ('manufacturers',))
+    if body is None:
+        body = jsonify([{'manufacturer': manufacturer, 'names': count}
+                        for manufacturer, count in current_tables.manufacturers()]).get_data()
+        lookup_cache.put(version, ('manufacturers',), body)
+    return _json_response(body, version)
+
+
+@app.route('/manufacturer')
+def manufacturer():
+    current_tables = tables
+    version = current_tables.data_version
+    not_modified = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
+    offset, limit = _page_args()
+    cache_key = ('manufacturer', request.args.get('name', '').strip().lower(), offset, limit)
+    if request.args.get('format') != 'ndjson':
+        body = page_cache.get(version, cache_key)
+        if body is not None:
+            return _json_response(body, version)
+    found = current_tables.manufacturer_names(request.args.get('name', ''), offset, limit)
+    if found is None:
+        return jsonify({'error': f"Unknown manufacturer '{request.args.get('name', '')}'."}), 404
+    display_name, total, names = found
+    response = _expansion_response(current_tables, version, {'manufacturer': display_name}, total, names,
+                                   _manufacturer_item, offset, limit)
+    if request.args.get('format') != 'ndjson':
+        page_cache.put(version, cache_key, response.get_data())
+    return response
+
+
+@app.route('/models')
+def models():
+    current_tables = tables
+    version = current_tables.data_version
+    not_modified = _not_modified(version)
+    if not_modified is not None:
+        return not_modified
+    prefix = request.args.get('prefix', '')
+    if not prefix.strip():
+        return jsonify({'error': "The 'prefix' parameter is required."}), 400
+    offset, limit = _page_args()
+    cache_key = ('models', prefix.strip().lower(), offset, limit)
+    if request.args.get('format') != 'ndjson':
+        body = page_cache.get(version, cache_key)
+        if body is not None:
+            return _json_response(body, version)
+    total, codes = current_tables.models_with_prefix(prefix, offset, limit)
+    response = _expansion_response(current_tables, version, {'prefix': prefix.strip()}, total, codes,
+                                   _model_item, offset, limit)
+    if request.args.get('format') != 'ndjson':
+        page_cache.put(version, cache_key, response.get_data())
+    return response
 
 
 @app.route('/batch_lookup', methods=['POST'])
 def batch_lookup():
-    queries = request.json.get('queries', [])
-    if not queries:
-        return jsonify({'error': 'No queries provided'}), 400
+    output_format = request.args.get('format', 'json')
+    fuzzy = request.args.get('fuzzy') in ('1', 'true')
+    if output_format not in ('json', 'ndjson', 'csv'):
+        return jsonify({'error': f"Unsupported format '{output_format}'. Use json, ndjson or csv."}), 400
+
+    # גוף text/plain נקרא שורה אחר שורה, בלי לטעון את כל הקלט לזיכרון
+    if request.mimetype == 'text/plain':
+        queries = _text_queries(request.stream)
+    else:
+        queries = (request.get_json(silent=True) or {}).get('queries', [])
+        if not queries:
+            return jsonify({'error': 'No queries provided'}), 400
+        if MAX_BATCH_LINES and len(queries) > MAX_BATCH_LINES:
+            return jsonify({'error': f'Too many queries: at most {MAX_BATCH_LINES} per batch.'}), 413
+
+    if output_format == 'ndjson':
+        return Response(stream_with_context(_stream_batch_ndjson(queries, fuzzy)), mimetype='application/x-ndjson')
+    if output_format == 'csv':
+        return Response(stream_with_context(_stream_batch_csv(queries, fuzzy)), mimetype='text/csv')
+
+    # תגובות JSON נשמרות לפי hash של גוף הבקשה (לא עבור text/plain, שנקרא בזרימה)
+    current_tables = tables
+    version = current_tables.data_version
+    cache_key = None
+    if request.mimetype != 'text/plain':
+        cache_key = (hashlib.sha256(request.get_data()).hexdigest(), fuzzy)
+        body = batch_cache.get(version, cache_key)
+        if body is not None:
+            return _json_response(body)
 
     results_output = []
     last_batch_models = set()
     last_batch_names = set()
 
-    for query in queries:
-        original_query = query.strip()
-        if not original_query:
-            continue
-        status_model, models_found, msg_model = _perform_single_lookup_logic(original_query, "model")
-        status_name, names_found, msg_name = _perform_single_lookup_logic(original_query, "name")
-        if status_model == "success":
-            results_output.append(f"Input: '{original_query}' -> Models: {','.join(models_found)}")
-            last_batch_models.update(models_found)
-            for model in models_found:
-                last_batch_names.update(internal_model_to_canonical_names.get(model, set()))
-        elif status_name == "success":
-            results_output.append(f"Input: '{original_query}' -> Names: {','.join(names_found)}")
-            last_batch_names.update(names_found)
-            last_batch_models.add(original_query)
-        else:
-            results_output.append(f"Input: '{original_query}' -> No direct match found.")
-
-    return jsonify({
-        'results_text': "\n".join(results_output),
-        'found_models': sorted(list(last_batch_models)),
-        'found_names': sorted(list(last_batch_names))
-    })
+    batch_results = _observed_batch(current_tables.iter_batch(queries, last_batch_models, last_batch_names, fuzzy))
+    try:
+        for original_query, kind, items, candidates in batch_results:
+            results_output.append(format_batch_line(original_query, kind, items, candidates))
+    except BatchTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+
+    if not results_output and request.mimetype == 'text/plain':
+        return jsonify({'error': 'No queries provided'}), 400
+
+    response = jsonify(batch_json_payload(results_output, last_batch_models, last_batch_names))
+    if cache_key is not None:
+        batch_cache.put(version, cache_key, response.get_data())
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    # טעינה מחדש חלה רק על ה-worker שקיבל את הבקשה; לריענון כל ה-workers השתמשו ב-DEVICE_MAPPING_WATCH_INTERVAL
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    ok, message = reload_data()
+    return jsonify({'status': 'success' if ok else 'error', 'message': message}), 200 if ok else 500
+
+
+@app.route('/admin/apply_deltas', methods=['POST'])
+def admin_apply_deltas():
+    # כמו /admin/reload, חל רק על ה-worker שקיבל את הבקשה
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    ok, message = apply_pending_deltas()
+    return jsonify({'status': 'success' if ok else 'error', 'message': message}), 200 if ok else 500
 
 
 if __name__ == '__main__':
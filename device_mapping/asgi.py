@@ -0,0 +1,281 @@
+"""
+ASGI entry point: `uvicorn asgi:app --workers 4`.
+
+Every route of app.py is served unchanged through a WSGI adapter running on
+a thread pool, except POST /batch_lookup. Batches are split into chunks and
+fanned out to a process (or thread) pool, so a large batch never holds the
+threads that answer /lookup and /suggest. At most MAX_CONCURRENT_BATCHES
+batches run at once; later ones wait their turn.
+
+Settings (environment variables):
+    DEVICE_MAPPING_BATCH_EXECUTOR           "process" (default) or "thread"
+    DEVICE_MAPPING_BATCH_WORKERS            pool size, default: number of CPUs
+    DEVICE_MAPPING_MAX_CONCURRENT_BATCHES   default 2
+    DEVICE_MAPPING_MAX_BATCH_LINES          shared with app.py, default 1,000,000
+    DEVICE_MAPPING_MAX_BATCH_BYTES          request body limit, default 256 MB
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import traceback
+import multiprocessing
+from collections import deque
+from urllib.parse import parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+
+import app as flask_app
+from device_index import DeviceIndex, format_ndjson_summary, batch_json_payload, csv_header
+
+BATCH_EXECUTOR = os.environ.get('DEVICE_MAPPING_BATCH_EXECUTOR', 'process')
+BATCH_WORKERS = int(os.environ.get('DEVICE_MAPPING_BATCH_WORKERS', 0)) or os.cpu_count() or 1
+MAX_CONCURRENT_BATCHES = int(os.environ.get('DEVICE_MAPPING_MAX_CONCURRENT_BATCHES', 2))
+MAX_BATCH_BYTES = int(os.environ.get('DEVICE_MAPPING_MAX_BATCH_BYTES', 256 * 1024 * 1024))
+# Lines per pool task: big enough to amortize the hand-off, small enough to stream steadily.
+BATCH_CHUNK_LINES = 5_000
+
+# (data_version, DeviceIndex) a worker process loaded itself because it was forked before
+# a reload or delta update; kept so the load happens once, not on every chunk.
+_reloaded_tables = None
+
+
+class _ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread; use the loop's thread pool so
+    # concurrent lookups don't queue behind each other.
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+
+def _resolve_chunk(data_version, queries, fuzzy, output_format):
+    """
+    Pool task: resolves one chunk of batch lines against the tables and formats it, since
+    text is much cheaper to send back from a worker process than the result rows.
+    Returns (output, found_models, found_names, seconds): output is the list of result lines
+    for the json format and the finished text of the chunk for ndjson and csv.
+    """
+    global _reloaded_tables
+    started = time.perf_counter()
+    tables = flask_app.tables
+    if tables.data_version != data_version and BATCH_EXECUTOR == 'process':
+        # This worker process was forked before the last reload or delta update.
+        if _reloaded_tables is None or _reloaded_tables[0] != data_version:
+            _reloaded_tables = (data_version, DeviceIndex.load(flask_app.BASE_PATH, flask_app.STORE_BACKEND))
+        tables = _reloaded_tables[1]
+    output, found_models, found_names = tables.format_batch(
+        queries, 'lines' if output_format == 'json' else output_format, fuzzy)
+    # The csv format has no summary line, so its found sets aren't sent back.
+    if output_format == 'csv':
+        found_models, found_names = set(), set()
+    return output, found_models, found_names, time.perf_counter() - started
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _make_executor():
+    if BATCH_EXECUTOR == 'thread':
+        return ThreadPoolExecutor(BATCH_WORKERS, thread_name_prefix='batch')
+    # Forked workers start with the parent's tables instead of loading or unpickling their own.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    executor = ProcessPoolExecutor(BATCH_WORKERS, mp_context=context)
+    # The first task forks every worker at once, so it runs now, before the loop has
+    # started the threads that answer requests; forking under those threads can deadlock.
+    executor.submit(_warm_up).result()
+    return executor
+
+
+class BatchFanOutApp:
+    """ASGI application: POST /batch_lookup goes to the pool, everything else to the Flask app."""
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+        self._executor = None
+        self._batch_slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/batch_lookup':
+            await self._batch_lookup(scope, receive, send)
+        elif scope['type'] == 'http':
+            await _ThreadPoolWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+    def _start_pool(self):
+        if self._executor is None:
+            self._executor = _make_executor()
+            self._batch_slots = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start_pool()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown(cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _batch_lookup(self, scope, receive, send):
+        args = {key: values[-1] for key, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        output_format = args.get('format', 'json')
+        fuzzy = args.get('fuzzy') in ('1', 'true')
+        if output_format not in ('json', 'ndjson', 'csv'):
+            return await _send_json(send, 400, {'error': f"Unsupported format '{output_format}'. "
+                                                         f"Use json, ndjson or csv."})
+        body = await _read_body(receive, MAX_BATCH_BYTES)
+        if body is None:
+            return await _send_json(send, 413, {'error': f'Request body larger than {MAX_BATCH_BYTES} bytes.'})
+
+        content_type = dict(scope['headers']).get(b'content-type', b'').split(b';')[0].strip()
+        # Parsing a large body takes a while, so it runs off the event loop.
+        queries = await asyncio.get_running_loop().run_in_executor(None, _parse_queries, body, content_type)
+        if not queries:
+            return await _send_json(send, 400, {'error': 'No queries provided'})
+        if flask_app.MAX_BATCH_LINES and len(queries) > flask_app.MAX_BATCH_LINES:
+            return await _send_json(send, 413, {'error': f'Too many queries: at most '
+                                                         f'{flask_app.MAX_BATCH_LINES} per batch.'})
+
+        # Normally started by the lifespan startup; servers run with lifespan off start it here.
+        self._start_pool()
+        started = time.perf_counter()
+        async with self._batch_slots:
+            chunks = self._resolve_in_order(queries, fuzzy, output_format)
+            if output_format == 'json':
+                status = await self._send_batch_json(send, chunks)
+            else:
+                status = await self._send_batch_stream(send, chunks, output_format, fuzzy)
+        # Requests answered here never reach the Flask hooks, so they are recorded directly.
+        flask_app.REQUEST_SECONDS.observe(time.perf_counter() - started, '/batch_lookup')
+        flask_app.REQUESTS.inc('/batch_lookup', 'POST', str(status))
+
+    async def _resolve_in_order(self, queries, fuzzy, output_format):
+        """
+        Yields the resolved chunks in input order, keeping at most BATCH_WORKERS of this batch in flight.
+        Records the batch metrics once every chunk is in.
+        """
+        loop = asyncio.get_running_loop()
+        data_version = flask_app.tables.data_version
+        pending = deque()
+        starts = iter(range(0, len(queries), BATCH_CHUNK_LINES))
+        for start in starts:
+            pending.append(loop.run_in_executor(self._executor, _resolve_chunk, data_version,
+                                                queries[start:start + BATCH_CHUNK_LINES], fuzzy, output_format))
+            if len(pending) >= BATCH_WORKERS:
+                break
+        seconds = 0.0
+        try:
+            while pending:
+                *result, chunk_seconds = await pending.popleft()
+                seconds += chunk_seconds
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(loop.run_in_executor(self._executor, _resolve_chunk, data_version,
+                                                        queries[start:start + BATCH_CHUNK_LINES], fuzzy, output_format))
+                yield result
+        finally:
+            # After a failed chunk (or a dropped client) the rest of the batch isn't needed.
+            for future in pending:
+                future.cancel()
+        flask_app.observe_batch(len(queries), seconds)
+
+    async def _send_batch_json(self, send, chunks):
+        """Sends the whole batch as one JSON body. Returns the response status."""
+        results_output, found_models, found_names = [], set(), set()
+        try:
+            async for lines, chunk_models, chunk_names in chunks:
+                results_output.extend(lines)
+                found_models.update(chunk_models)
+                found_names.update(chunk_names)
+        except Exception as e:
+            _log_chunk_error()
+            await _send_json(send, 500, {'error': f'Batch lookup failed: {e}'})
+            return 500
+        payload = batch_json_payload(results_output, found_models, found_names)
+        await _send_json(send, 200, payload)
+        return 200
+
+    async def _send_batch_stream(self, send, chunks, output_format, fuzzy):
+        content_type = b'application/x-ndjson' if output_format == 'ndjson' else b'text/csv; charset=utf-8'
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', content_type)]})
+        if output_format == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(csv_header(fuzzy))
+            await send({'type': 'http.response.body', 'body': buffer.getvalue().encode('utf-8'), 'more_body': True})
+        found_models, found_names = set(), set()
+        try:
+            async for text, chunk_models, chunk_names in chunks:
+                found_models.update(chunk_models)
+                found_names.update(chunk_names)
+                await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+        except Exception as e:
+            # The 200 status is already sent, so the failure ends the stream as its last line
+            # in place of the summary; a client that finds no summary knows the batch is incomplete.
+            _log_chunk_error()
+            await send({'type': 'http.response.body', 'body': _stream_error(output_format, e).encode('utf-8')})
+            return 500
+        tail = format_ndjson_summary(found_models, found_names) + "\n" if output_format == 'ndjson' else ""
+        await send({'type': 'http.response.body', 'body': tail.encode('utf-8')})
+        return 200
+
+
+def _log_chunk_error():
+    print("Batch lookup chunk failed:", file=sys.stderr)
+    traceback.print_exc()
+
+
+def _stream_error(output_format, error):
+    """The final ndjson line or csv row that reports a batch which failed part way through."""
+    message = f'Batch lookup failed: {error}'
+    if output_format == 'ndjson':
+        return json.dumps({'error': message}) + "\n"
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(['', 'error', message])
+    return buffer.getvalue()
+
+
+def _parse_queries(body, content_type):
+    """The non-empty batch lines of a text/plain body, or the "queries" list of a JSON body."""
+    if content_type == b'text/plain':
+        return [line for line in body.decode('utf-8', 'replace').splitlines() if line.strip()]
+    try:
+        return json.loads(body).get('queries', [])
+    except (ValueError, AttributeError):
+        return []
+
+
+async def _read_body(receive, limit):
+    """Reads the whole request body, or returns None once it exceeds limit bytes."""
+    parts, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            return None
+        parts.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(parts)
+
+
+async def _send_json(send, status, payload):
+    # app.json.response() is what jsonify() uses, so the body matches app.py's byte for byte.
+    body = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: flask_app.app.json.response(payload).get_data())
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+app = BatchFanOutApp(flask_app.app)
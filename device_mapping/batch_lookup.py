@@ -0,0 +1,178 @@
+"""
+Offline batch lookup: resolves a file of device names/models on every CPU.
+
+    python batch_lookup.py devices.txt -o results.txt
+    python batch_lookup.py export.csv --header --column device --format csv -o results.csv
+    cat devices.txt | python batch_lookup.py - --format ndjson > results.ndjson
+
+The input is plain text (one query per line) or one column of a CSV/TSV
+file. The lookup tables are loaded once in the parent process and shared
+with the forked workers, so adding workers costs no extra load time and
+little extra memory. Input is split into chunks; results are written as
+they complete, always in input order, with only a few chunks in flight
+per worker so memory stays flat on inputs of any size.
+"""
+import io
+import os
+import gc
+import sys
+import csv
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+
+from device_index import DeviceIndex, csv_header, format_ndjson_summary
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Lines per pool task, and pool tasks kept in flight per worker.
+CHUNK_LINES = 5_000
+CHUNKS_PER_WORKER = 2
+
+_index = None  # The DeviceIndex used by this process
+
+
+def _init_worker(base_path, store):
+    # Only needed where workers don't inherit the parent's index through fork.
+    global _index
+    if _index is None:
+        _index = DeviceIndex.load(base_path, store)
+
+
+def _resolve_chunk(queries, output_format, fuzzy):
+    output, found_models, found_names = _index.format_batch(queries, output_format, fuzzy)
+    if output_format == 'lines':
+        output = "".join(line + "\n" for line in output)
+    return output, found_models, found_names
+
+
+def read_queries(stream, input_format='text', column=0, header=False):
+    """
+    Yields the non-empty queries of stream: every line for input_format "text", or the given
+    column (an index, or a header name when header is set) of each "csv"/"tsv" row.
+    """
+    if input_format == 'text':
+        for line in stream:
+            line = line.rstrip('\r\n')
+            if line.strip():
+                yield line
+        return
+
+    rows = csv.reader(stream, delimiter='\t' if input_format == 'tsv' else ',')
+    if header:
+        names = next(rows, [])
+        if not str(column).isdigit():
+            if column not in names:
+                raise ValueError(f"Column '{column}' not found in the header: {', '.join(names)}")
+            column = names.index(column)
+    elif not str(column).isdigit():
+        raise ValueError(f"Column '{column}' must be an index unless the input has a header row")
+    column = int(column)
+    for row in rows:
+        if column < len(row) and row[column].strip():
+            yield row[column]
+
+
+def iter_chunks(queries, size):
+    """Yields lists of up to size queries."""
+    queries = iter(queries)
+    while True:
+        chunk = list(itertools.islice(queries, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _resolve_in_order(chunks, output_format, fuzzy, workers, base_path, store):
+    """Yields (output, found_models, found_names) per chunk, in input order."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield _resolve_chunk(chunk, output_format, fuzzy)
+        return
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    # Objects that exist before the fork are never collected in the workers, so their
+    # pages aren't copied by the collector touching reference counts of the whole index.
+    gc.freeze()
+    with context.Pool(workers, _init_worker, (base_path, store)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_resolve_chunk, (chunk, output_format, fuzzy)))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def run(queries, out, output_format='text', fuzzy=False, workers=1, base_path=BASE_PATH, store='dict'):
+    """
+    Resolves queries and writes the results to the text stream out.
+    Returns the sets of found models and found names.
+    """
+    global _index
+    _index = DeviceIndex.load(base_path, store)
+    if fuzzy:
+        # Built once before the workers are forked, instead of once in every worker.
+        _index.fuzzy_index
+
+    index_format = 'lines' if output_format == 'text' else output_format
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(csv_header(fuzzy))
+        out.write(buffer.getvalue())
+
+    found_models, found_names = set(), set()
+    chunks = iter_chunks(queries, CHUNK_LINES)
+    for output, chunk_models, chunk_names in _resolve_in_order(chunks, index_format, fuzzy, workers,
+                                                               base_path, store):
+        out.write(output)
+        found_models.update(chunk_models)
+        found_names.update(chunk_names)
+    if output_format == 'ndjson':
+        out.write(format_ndjson_summary(found_models, found_names) + "\n")
+    return found_models, found_names
+
+
+def input_format_for(path, requested=None):
+    """The requested input format, or the one the file extension implies ("text" by default)."""
+    if requested:
+        return requested
+    extension = os.path.splitext(path)[1].lower()
+    return {'.csv': 'csv', '.tsv': 'tsv'}.get(extension, 'text')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help="input file, or - for stdin")
+    parser.add_argument('-o', '--output', help="write the results to this file instead of stdout")
+    parser.add_argument('--input-format', choices=('text', 'csv', 'tsv'),
+                        help="default: by the file extension, text for stdin")
+    parser.add_argument('--column', default='0', help="CSV/TSV column to read: index, or name with --header")
+    parser.add_argument('--header', action='store_true', help="the CSV/TSV input starts with a header row")
+    parser.add_argument('--format', default='text', choices=('text', 'ndjson', 'csv'), help="output format")
+    parser.add_argument('--fuzzy', action='store_true', help="add \"did you mean\" candidates for unmatched lines")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes, default: number of CPUs (1 runs in this process)")
+    parser.add_argument('--store', default='dict', choices=('dict', 'mmap'))
+    args = parser.parse_args()
+
+    input_stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', newline='')
+    output_stream = sys.stdout if not args.output else open(args.output, 'w', encoding='utf-8', newline='')
+    started = time.perf_counter()
+    try:
+        queries = read_queries(input_stream, input_format_for(args.input, args.input_format), args.column, args.header)
+        found_models, found_names = run(queries, output_stream, args.format, args.fuzzy, args.workers,
+                                        BASE_PATH, args.store)
+    except (ValueError, csv.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s. Found {len(found_models)} unique models "
+          f"and {len(found_names)} unique names.", file=sys.stderr)
@@ -0,0 +1,197 @@
+"""
+Reproducible benchmarks for loading, single lookups, batch lookups and suggestions.
+
+Run `python benchmark.py --output before.json` on one commit and
+`python benchmark.py --output after.json` on another, then compare the two
+files. Queries are drawn from the real data files with a fixed seed, so two
+runs on the same data measure the same workload. Every probe goes through
+`import app` and its HTTP routes only, so this file can be copied into an
+older checkout and measure it the same way.
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Share of hits, case variants of hits and misses in a generated query mix
+DEFAULT_MIX = {'hit': 0.7, 'case_variant': 0.2, 'miss': 0.1}
+BATCH_SIZES = (1_000, 10_000, 100_000)
+
+# Written next to the data files by versions that have the mmap store
+SNAPSHOT_FILE = 'lookup_tables.snapshot'
+
+# Runs in a fresh interpreter so the load is cold (no module or table state left over). The app loads
+# its tables on import; the store is picked with DEVICE_MAPPING_STORE, which older versions ignore.
+_LOAD_PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+started = time.perf_counter()
+import app
+seconds = time.perf_counter() - started
+peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+suggestions = len(app.app.test_client().get('/suggestions').get_json())
+print(json.dumps({'seconds': seconds, 'peak_rss_kb': peak_rss_kb, 'suggestions': suggestions}))
+"""
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _latency_summary(seconds):
+    seconds = sorted(seconds)
+    return {
+        'count': len(seconds),
+        'p50_ms': round(_percentile(seconds, 0.50) * 1000, 4),
+        'p99_ms': round(_percentile(seconds, 0.99) * 1000, 4),
+        'max_ms': round(seconds[-1] * 1000, 4),
+    }
+
+
+def _case_variant(text, rng):
+    variant = ''.join(char.upper() if rng.random() < 0.5 else char.lower() for char in text)
+    return f"  {variant} " if rng.random() < 0.3 else variant
+
+
+def _miss(text, rng):
+    # Keeps the shape of a real query but makes sure it isn't an alias.
+    return f"{text} {rng.choice('qxz')}{rng.randrange(1000, 9999)}"
+
+
+def generate_queries(known_strings, count, mix=DEFAULT_MIX, seed=0):
+    """Returns count queries drawn from known_strings in the given hit/case-variant/miss ratios."""
+    rng = random.Random(seed)
+    population = sorted(known_strings)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    queries = []
+    for kind in rng.choices(kinds, weights, k=count):
+        text = rng.choice(population)
+        if kind == 'case_variant':
+            text = _case_variant(text, rng)
+        elif kind == 'miss':
+            text = _miss(text, rng)
+        queries.append(text)
+    return queries
+
+
+def bench_cold_load(store):
+    """Times `import app`, which loads the tables, and measures peak RSS in a fresh process."""
+    output = subprocess.run([sys.executable, '-c', _LOAD_PROBE, BASE_PATH], cwd=BASE_PATH,
+                            env=dict(os.environ, DEVICE_MAPPING_STORE=store),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_single_lookup(client, queries):
+    timings = []
+    for i, query in enumerate(queries):
+        search_type = 'model' if i % 2 == 0 else 'name'
+        started = time.perf_counter()
+        response = client.get('/lookup', query_string={'query': query, 'type': search_type})
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    return _latency_summary(timings)
+
+
+def bench_batch_lookup(client, queries, output_format='json'):
+    started = time.perf_counter()
+    response = client.post('/batch_lookup', query_string={'format': output_format}, json={'queries': queries})
+    body = response.get_data()
+    seconds = time.perf_counter() - started
+    assert response.status_code == 200, response.status_code
+    return {
+        'lines': len(queries),
+        'format': output_format,
+        'seconds': round(seconds, 4),
+        'lines_per_second': round(len(queries) / seconds),
+        'response_bytes': len(body),
+    }
+
+
+def bench_suggestions(client, prefixes, repeats=5):
+    full_timings = []
+    payload_bytes = 0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = client.get('/suggestions')
+        payload_bytes = len(response.get_data())
+        full_timings.append(time.perf_counter() - started)
+    prefix_timings = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        response = client.get('/suggest', query_string={'q': prefix})
+        prefix_timings.append(time.perf_counter() - started)
+        if response.status_code == 404:
+            # Versions before /suggest only have the full list.
+            prefix_timings = []
+            break
+    return {
+        'suggestions': dict(_latency_summary(full_timings), payload_bytes=payload_bytes),
+        'suggest': _latency_summary(prefix_timings) if prefix_timings else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_PATH,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(single_queries=2_000, batch_sizes=BATCH_SIZES, seed=0):
+    """Runs every benchmark and returns the results as a JSON-serializable dict."""
+    results = {
+        'commit': _git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'query_mix': DEFAULT_MIX,
+        'cold_load': {'dict': bench_cold_load('dict')},
+    }
+    if os.path.exists(os.path.join(BASE_PATH, SNAPSHOT_FILE)):
+        results['cold_load']['mmap'] = bench_cold_load('mmap')
+
+    sys.path.insert(0, BASE_PATH)
+    import app
+    client = app.app.test_client()
+    known_strings = client.get('/suggestions').get_json()
+
+    results['single_lookup'] = bench_single_lookup(client, generate_queries(known_strings, single_queries, seed=seed))
+    results['batch_lookup'] = [
+        bench_batch_lookup(client, generate_queries(known_strings, size, seed=seed + size))
+        for size in batch_sizes
+    ]
+    rng = random.Random(seed)
+    prefixes = [text[:rng.randint(1, 6)] for text in generate_queries(known_strings, 500, {'hit': 1}, seed)]
+    results.update(bench_suggestions(client, prefixes))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help="write the results to this JSON file instead of stdout")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--single-queries', type=int, default=2_000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(BATCH_SIZES))
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.single_queries, args.batch_sizes, args.seed)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"Benchmark results written to {args.output}")
+    else:
+        print(text)
@@ -0,0 +1,239 @@
+"""
+Incremental changes to the device tables, stored as append-only delta files.
+
+Every `deltas/*.delta` file holds one JSON operation per line, applied in
+file-name order on top of the base tables:
+
+    {"op": "add_model", "name": "Galaxy S25", "model": "SM-S931B"}
+    {"op": "remove_model", "name": "Galaxy S25", "model": "SM-S931B"}
+    {"op": "add_alias", "alias": "Samsung Galaxy S25", "name": "Galaxy S25"}
+    {"op": "remove_alias", "alias": "Samsung Galaxy S25"}
+
+Blank lines and lines starting with '#' are ignored. The precedence rules
+match the load of mapping_devices.txt, so a delta line and the same entry in
+the source files resolve alike: add_model sets the canonical name alias even
+over a model alias and then the model alias, which replaces any name alias,
+while add_alias never replaces a model alias.
+
+`python deltas.py check` validates the delta files and `python deltas.py compact`
+folds them into a new base snapshot (the same as `python lookup_tables.py`).
+"""
+import os
+import sys
+import json
+import hashlib
+
+DELTA_DIR = 'deltas'
+DELTA_SUFFIX = '.delta'
+_OP_FIELDS = {
+    'add_model': ('name', 'model'),
+    'remove_model': ('name', 'model'),
+    'add_alias': ('alias', 'name'),
+    'remove_alias': ('alias',),
+}
+
+
+class DeltaError(ValueError):
+    """A delta file is malformed, or changed in a way that can't be applied incrementally."""
+
+
+def list_delta_files(base_path):
+    """Returns the delta file names in application order."""
+    try:
+        filenames = os.listdir(os.path.join(base_path, DELTA_DIR))
+    except OSError:
+        return []
+    return sorted(filename for filename in filenames if filename.endswith(DELTA_SUFFIX))
+
+
+def _delta_path(base_path, filename):
+    return os.path.join(base_path, DELTA_DIR, filename)
+
+
+def _prefix_sha256(path, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = size
+        while remaining:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def delta_records(base_path, offsets):
+    """Describes how much of each delta file has been applied, for storing in a snapshot."""
+    return {
+        filename: {'size': offset, 'sha256': _prefix_sha256(_delta_path(base_path, filename), offset)}
+        for filename, offset in offsets.items()
+    }
+
+
+def folded_delta_offsets(base_path, records):
+    """
+    Checks the delta records stored in a snapshot against the files on disk.
+    Returns {filename: applied_offset}, or None if a folded file was removed or rewritten.
+    """
+    offsets = {}
+    for filename, record in records.items():
+        path = _delta_path(base_path, filename)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        if size < record['size'] or _prefix_sha256(path, record['size']) != record['sha256']:
+            return None
+        offsets[filename] = record['size']
+    return offsets
+
+
+def _validate_op(op):
+    if not isinstance(op, dict) or op.get('op') not in _OP_FIELDS:
+        raise DeltaError(f"unknown operation {op!r}.")
+    for field in _OP_FIELDS[op['op']]:
+        value = op.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise DeltaError(f"'{op['op']}' needs a non-empty '{field}'.")
+    return dict({field: op[field].strip() for field in _OP_FIELDS[op['op']]}, op=op['op'])
+
+
+def read_delta_ops(base_path, filename, offset=0):
+    """
+    Parses the complete lines of a delta file after byte offset.
+    A last line without a newline is still being written and is left for later.
+    Returns (ops, new_offset).
+    """
+    path = _delta_path(base_path, filename)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    ops = []
+    for line_index, raw_line in enumerate(data[:end].splitlines()):
+        try:
+            line = raw_line.decode('utf-8').strip()
+            if not line or line.startswith('#'):
+                continue
+            ops.append(_validate_op(json.loads(line)))
+        except (UnicodeDecodeError, json.JSONDecodeError, DeltaError) as e:
+            raise DeltaError(f"{filename}:{_line_number(path, offset, line_index)}: {e}") from None
+    return ops, offset + end
+
+
+def _line_number(path, offset, line_index):
+    """1-based line number of the line_index-th line after byte offset (only computed for error messages)."""
+    with open(path, 'rb') as f:
+        return f.read(offset).count(b'\n') + line_index + 1
+
+
+def pending_delta_ops(base_path, offsets):
+    """
+    Reads every operation not covered by offsets ({filename: applied_offset}).
+    Returns (ops, new_offsets); offsets itself is left untouched.
+    Raises DeltaError if an applied file shrank or disappeared, or a file can't be read.
+    """
+    new_offsets = dict(offsets)
+    filenames = list_delta_files(base_path)
+    missing = set(offsets) - set(filenames)
+    if missing:
+        raise DeltaError(f"Applied delta files were removed: {', '.join(sorted(missing))}.")
+    ops = []
+    for filename in filenames:
+        offset = offsets.get(filename, 0)
+        try:
+            size = os.path.getsize(_delta_path(base_path, filename))
+            if size < offset:
+                raise DeltaError(f"{filename} shrank; delta files are append-only.")
+            if size > offset:
+                file_ops, new_offsets[filename] = read_delta_ops(base_path, filename, offset)
+                ops.extend(file_ops)
+        except OSError as e:
+            # Removed or replaced between the listing and the read.
+            raise DeltaError(f"{filename} can't be read: {e}") from None
+    return ops, new_offsets
+
+
+def _set_alias(search_aliases, key, value, changes):
+    old_value = search_aliases.get(key)
+    if old_value != value:
+        search_aliases[key] = value
+        changes.append((key, old_value, value))
+
+
+def _remove_alias(search_aliases, key, changes):
+    old_value = search_aliases.pop(key, None)
+    if old_value is not None:
+        changes.append((key, old_value, None))
+
+
+def apply_delta_ops(search_aliases, canonical_name_to_internal_models, internal_model_to_canonical_names, ops):
+    """
+    Applies delta operations to the tables in place, in time proportional to len(ops).
+    Relation values are replaced with new sets rather than mutated, and a new relation is stored before
+    the alias that points to it (removals go the other way round), so concurrent readers
+    never follow an alias to a missing entry.
+    Returns the alias changes as (alias_key, old_value, new_value) tuples.
+    """
+    changes = []
+    for op in ops:
+        kind = op['op']
+        if kind == 'add_model':
+            name, model = op['name'], op['model']
+            canonical_name_to_internal_models[name] = set(canonical_name_to_internal_models.get(name, ())) | {model}
+            internal_model_to_canonical_names[model] = set(internal_model_to_canonical_names.get(model, ())) | {name}
+            # Like a canonical name in mapping_devices.txt, the name alias replaces a model alias.
+            _set_alias(search_aliases, name.lower(), ("name", name), changes)
+            _set_alias(search_aliases, model.lower(), ("model", model), changes)
+        elif kind == 'remove_model':
+            name, model = op['name'], op['model']
+            names = internal_model_to_canonical_names.get(model, ())
+            if name not in names:
+                continue
+            remaining_names = set(names) - {name}
+            if not remaining_names and search_aliases.get(model.lower()) == ("model", model):
+                _remove_alias(search_aliases, model.lower(), changes)
+            if remaining_names:
+                internal_model_to_canonical_names[model] = remaining_names
+            else:
+                del internal_model_to_canonical_names[model]
+            if name in canonical_name_to_internal_models:
+                canonical_name_to_internal_models[name] = set(canonical_name_to_internal_models[name]) - {model}
+        elif kind == 'add_alias':
+            key = op['alias'].lower()
+            if search_aliases.get(key, (None, None))[0] != "model":
+                _set_alias(search_aliases, key, ("name", op['name']), changes)
+        elif kind == 'remove_alias':
+            key = op['alias'].lower()
+            # Model aliases belong to their model and go away with remove_model.
+            if search_aliases.get(key, (None, None))[0] == "name":
+                _remove_alias(search_aliases, key, changes)
+    return changes
+
+
+def check_deltas(base_path):
+    """Parses every delta file; returns the number of operations or raises DeltaError."""
+    ops, _ = pending_delta_ops(base_path, {})
+    return len(ops)
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    data_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(os.path.abspath(__file__))
+    try:
+        if command == 'check':
+            print(f"{check_deltas(data_dir)} delta operations OK.")
+        elif command == 'compact':
+            from lookup_tables import build_snapshot
+            print(f"Deltas folded into {build_snapshot(data_dir)}")
+        else:
+            print("Usage: python deltas.py check|compact [data_dir]")
+            sys.exit(2)
+    except DeltaError as e:
+        print(f"Delta error: {e}")
+        sys.exit(1)
+    except ValueError as e:
+        # DataError from build_snapshot(): the base files themselves don't parse
+        print(f"Data error: {e} (run 'python lookup_tables.py --check' for the full report)")
+        sys.exit(1)
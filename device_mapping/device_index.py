@@ -0,0 +1,466 @@
+"""
+The lookup engine shared by the Flask app (app.py) and the desktop tool (device_names.py).
+
+A DeviceIndex owns one complete set of lookup tables and every index derived
+from them, and answers single lookups, batch lookups and suggestions. Both
+front ends only format its results, so the two always behave the same.
+"""
+import io
+import os
+import sys
+import csv
+import json
+import hashlib
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from suggest_index import SuggestionIndex, suggestion_weights
+from lookup_tables import load_tables, source_fingerprints
+from interned_tables import model_sort_key
+from mapped_tables import open_mapped_tables
+from fuzzy_index import FuzzyIndex
+from normalizer import NormalizedKeyIndex
+from deltas import apply_delta_ops, pending_delta_ops
+from result_cache import ResultCache
+
+# Distinct normalized queries remembered while resolving one batch
+BATCH_MEMO_SIZE = 100_000
+
+# Near-miss (fuzzy) matching: number of candidates and the time budget for one query
+FUZZY_LIMIT = 5
+FUZZY_BUDGET_MS = float(os.environ.get('DEVICE_MAPPING_FUZZY_BUDGET_MS', 20))
+# Distinct queries whose fuzzy candidates are remembered (the slowest part of a lookup)
+FUZZY_CACHE_SIZE = 10_000
+
+
+class DeviceIndex:
+    """
+    One complete set of lookup tables and the indexes derived from them.
+    After the build it only changes through apply_pending_deltas(); read_only tables (mmap) never change.
+    data_version identifies the content, so every process serving the same data files
+    and delta lines reports the same version.
+    """
+
+    def __init__(self, search_aliases, canonical_name_to_internal_models, internal_model_to_canonical_names,
+                 delta_offsets=None, read_only=False, base_path=None, alias_weights=None, source_digests=None,
+                 manufacturers=None, indexes=None):
+        self.search_aliases = search_aliases
+        self.canonical_name_to_internal_models = canonical_name_to_internal_models
+        self.internal_model_to_canonical_names = internal_model_to_canonical_names
+        # {delta_filename: applied_byte_offset}
+        self.delta_offsets = delta_offsets or {}
+        self.read_only = read_only
+        self.base_path = base_path
+        self._suggestion_refs = None
+        self._source_digests = source_digests
+        self._refresh_data_version()
+        self.fuzzy_cache = ResultCache(FUZZY_CACHE_SIZE)
+
+        # The derived indexes of steps 4, 6 and 7 are compiled into the snapshot, and indexes holds
+        # their tables ({'normalized_keys', 'suggestions', 'model_prefixes'}); they are only built
+        # here for tables that don't come from one
+        indexes = indexes or {}
+
+        # Step 4: Autocomplete suggestions, weighted by the device counts of their aliases
+        if 'suggestions' in indexes:
+            self.suggestion_index = SuggestionIndex(indexes['suggestions'])
+        else:
+            self.suggestion_index = SuggestionIndex.build(*suggestion_weights(search_aliases, alias_weights or {}))
+
+        # Step 5: The trigram index for near-miss (fuzzy) matching is built on first use (see fuzzy_index),
+        # so processes that never get a fuzzy query don't pay for it
+        self._fuzzy_index = None
+        self._fuzzy_lock = threading.Lock()
+
+        # Step 6: Every alias under its normalized form (punctuation, Unicode, 5G/year suffixes)
+        if 'normalized_keys' in indexes:
+            self.normalized_key_index = NormalizedKeyIndex(indexes['normalized_keys'])
+        else:
+            self.normalized_key_index = NormalizedKeyIndex.build(search_aliases)
+
+        # Step 7: Reverse indexes: canonical names per manufacturer, and model codes sorted for prefix ranges
+        self._manufacturer_index = _manufacturer_index(manufacturers or {})
+        if 'model_prefixes' in indexes:
+            self._model_prefix_index = indexes['model_prefixes']
+        else:
+            self._model_prefix_index = self._build_model_prefix_index()
+
+    @classmethod
+    def load(cls, base_path, store='dict'):
+        """
+        Builds a DeviceIndex from the data files in base_path. Raises on any loading error.
+        store="mmap" maps the snapshot file instead of loading the tables into memory.
+        """
+        # Steps 1-3: Map or load the tables from the snapshot, or parse the .txt files if it is stale,
+        # and apply the delta files on top of them
+        mapped_tables = open_mapped_tables(base_path) if store == 'mmap' else None
+        if mapped_tables is not None:
+            index = cls(mapped_tables.search_aliases,
+                        mapped_tables.canonical_name_to_internal_models,
+                        mapped_tables.internal_model_to_canonical_names,
+                        mapped_tables.delta_offsets, read_only=True, base_path=base_path,
+                        source_digests=_source_digests(mapped_tables.header['sources']),
+                        manufacturers=mapped_tables.manufacturers, indexes=mapped_tables.indexes)
+        else:
+            if store == 'mmap':
+                print("No snapshot that is fresh and includes all delta files; loading the tables into memory instead.",
+                      file=sys.stderr)
+            fingerprints = source_fingerprints(base_path)
+            delta_offsets, alias_weights, manufacturers, indexes = {}, {}, {}, {}
+            # The delta files the snapshot doesn't include yet are applied below, with the derived indexes.
+            tables = load_tables(base_path, delta_offsets, alias_weights, manufacturers, indexes)
+            index = cls(*tables, delta_offsets, base_path=base_path, alias_weights=alias_weights,
+                        source_digests=_source_digests(fingerprints), manufacturers=manufacturers,
+                        indexes=indexes)
+            index.apply_pending_deltas()
+        return index
+
+    def _refresh_data_version(self):
+        state = [self._source_digests, sorted(self.delta_offsets.items())]
+        self.data_version = hashlib.sha256(json.dumps(state).encode('utf-8')).hexdigest()[:16]
+
+    @property
+    def fuzzy_index(self):
+        """The trigram index over the alias keys, built by the first caller (about a second)."""
+        if self._fuzzy_index is None:
+            with self._fuzzy_lock:
+                if self._fuzzy_index is None:
+                    self._fuzzy_index = FuzzyIndex(self.search_aliases)
+        return self._fuzzy_index
+
+    @property
+    def all_suggestions(self):
+        """Every autocomplete string: a read-only set view of the suggestion index."""
+        return self.suggestion_index
+
+    def _apply_delta(self, ops):
+        if not ops:
+            return []
+        if self._suggestion_refs is None:
+            # How many aliases point at each suggestion, so a shared one is only dropped with its last alias.
+            self._suggestion_refs = Counter(original_key for _, original_key in self.search_aliases.values())
+        refs = self._suggestion_refs
+        models = {op['model'] for op in ops if op['op'] in ('add_model', 'remove_model')}
+        listed_before = {model for model in models if model in self.internal_model_to_canonical_names}
+        # Held so a fuzzy index build never iterates the aliases while they change; one built
+        # after the change already includes it.
+        with self._fuzzy_lock:
+            changes = apply_delta_ops(self.search_aliases, self.canonical_name_to_internal_models,
+                                      self.internal_model_to_canonical_names, ops)
+            fuzzy_index = self._fuzzy_index
+        added, removed = set(), set()
+        for alias_key, old_value, new_value in changes:
+            if old_value is None:
+                if fuzzy_index is not None:
+                    fuzzy_index.add(alias_key)
+                self.normalized_key_index.add(alias_key)
+            elif new_value is None:
+                if fuzzy_index is not None:
+                    fuzzy_index.discard(alias_key)
+                self.normalized_key_index.discard(alias_key)
+            if new_value is not None:
+                refs[new_value[1]] += 1
+                if refs[new_value[1]] == 1:
+                    added.add(new_value[1])
+                    removed.discard(new_value[1])
+            if old_value is not None:
+                refs[old_value[1]] -= 1
+                if refs[old_value[1]] <= 0:
+                    del refs[old_value[1]]
+                    removed.add(old_value[1])
+                    added.discard(old_value[1])
+        # Strings that were never in the tables have no device count; a removed one comes back with its own.
+        for suggestion in added:
+            self.suggestion_index.add(suggestion)
+        for suggestion in removed:
+            self.suggestion_index.discard(suggestion)
+        # Only a model's first name adds it to the prefix index, and only its last one removes it.
+        for model in models:
+            listed = model in self.internal_model_to_canonical_names
+            if listed != (model in listed_before):
+                self._update_model_prefix_index(model, listed)
+        return changes
+
+    def apply_pending_deltas(self):
+        """
+        Applies the delta lines appended since the tables were loaded.
+        Returns (ops, changes); raises DeltaError if a delta file is malformed or was rewritten.
+        """
+        ops, delta_offsets = pending_delta_ops(self.base_path, self.delta_offsets)
+        changes = self._apply_delta(ops)
+        self.delta_offsets = delta_offsets
+        self._refresh_data_version()
+        return ops, changes
+
+    def find_alias(self, query_text):
+        """
+        Looks a query up by its exact lowercase key, then by its canonical normalized form
+        (Unicode look-alikes and separators). Matches that need release tags dropped are
+        only offered as candidates, see relaxed_candidate().
+        """
+        lookup_result = self.search_aliases.get(query_text.strip().lower())
+        if lookup_result is None:
+            match = self.normalized_key_index.get(query_text)
+            if match is not None and not match[1]:
+                lookup_result = self.search_aliases.get(match[0])
+        return lookup_result
+
+    def relaxed_candidate(self, query_text):
+        """
+        The alias that query_text matches once trailing 5G/LTE/year tags are dropped, as a
+        candidate flagged "relaxed", or None. "A5 2017" meets ZTE's "A5" this way, so such a
+        match is never returned as a result.
+        """
+        match = self.normalized_key_index.get(query_text)
+        lookup_result = self.search_aliases.get(match[0]) if match is not None and match[1] else None
+        if lookup_result is None:
+            return None
+        alias_type, original_key = lookup_result
+        return {'match': original_key, 'type': alias_type, 'score': 1.0, 'relaxed': True}
+
+    def lookup(self, query_text, search_type):
+        """
+        Performs the core lookup logic for a single query.
+        Returns a tuple: (result_type, list_of_found_items, message_for_user)
+        """
+        normalized_query = query_text.strip().lower()
+        if not normalized_query:
+            return "error", [], "Empty query."
+        lookup_result = self.find_alias(normalized_query)
+        if lookup_result:
+            lookup_alias_type, canonical_key_string = lookup_result
+            if search_type == "model":
+                if lookup_alias_type == "name":
+                    models = self.canonical_name_to_internal_models.get(canonical_key_string)
+                    if models:
+                        return "success", sorted(list(models)), f"Models for '{canonical_key_string}':"
+                    else:
+                        return "not_found", [], f"No internal models found for '{canonical_key_string}'."
+                elif lookup_alias_type == "model":
+                    return "info", [], f"'{query_text}' is an internal model. Use 'Search Name' to find its name(s)."
+            elif search_type == "name":
+                if lookup_alias_type == "model":
+                    names = self.internal_model_to_canonical_names.get(canonical_key_string)
+                    if names:
+                        return "success", sorted(list(names)), f"Names for internal model '{canonical_key_string}':"
+                    else:
+                        return "not_found", [], f"No device names found for internal model '{canonical_key_string}'."
+                elif lookup_alias_type == "name":
+                    return "info", [], f"'{query_text}' is a device name. Use 'Search Model' to find its internal model(s)."
+            return "not_found", [], f"No direct match found for '{query_text}'."
+        candidate = self.relaxed_candidate(normalized_query)
+        if candidate is not None:
+            return "not_found", [], f"No direct match found for '{query_text}'. Did you mean '{candidate['match']}'?"
+        return "not_found", [], f"No direct match found for '{query_text}'."
+
+    def suggest(self, query, limit=20):
+        """Returns up to `limit` autocomplete suggestions for query, best first."""
+        return self.suggestion_index.search(query, limit)
+
+    def manufacturers(self):
+        """Returns [(manufacturer, number of canonical names)], sorted case-insensitively."""
+        return [(display_name, len(names)) for _, (display_name, names) in sorted(self._manufacturer_index.items())]
+
+    def manufacturer_names(self, manufacturer, offset=0, limit=None):
+        """
+        Returns (manufacturer, total, names) with one page of the sorted canonical names of a
+        manufacturer, matched case-insensitively, or None if the manufacturer is unknown.
+        """
+        entry = self._manufacturer_index.get(manufacturer.strip().lower())
+        if entry is None:
+            return None
+        display_name, names = entry
+        end = len(names) if limit is None else offset + limit
+        return display_name, len(names), names[offset:end]
+
+    def models_with_prefix(self, prefix, offset=0, limit=None):
+        """
+        Returns (total, models) with one page of the model codes starting with prefix
+        (case-insensitive), sorted by their lowercase form.
+        """
+        lowercase_codes, codes = self._model_prefix_index
+        prefix = prefix.strip().lower()
+        start = bisect_left(lowercase_codes, prefix)
+        # Every code with the prefix sorts before prefix + the highest code point.
+        stop = bisect_left(lowercase_codes, prefix + '\U0010ffff', start)
+        end = stop if limit is None else min(stop, start + offset + limit)
+        return stop - start, codes[start + offset:end]
+
+    def _build_model_prefix_index(self):
+        codes = sorted(self.internal_model_to_canonical_names, key=model_sort_key)
+        return [code.lower() for code in codes], codes
+
+    def _update_model_prefix_index(self, model, listed):
+        """Inserts model into the prefix index (listed=True) or removes it, keeping model_sort_key order."""
+        lowercase_codes, codes = self._model_prefix_index
+        if not isinstance(codes, list):
+            # A mapped snapshot's index is a read-only view; the first change copies it.
+            lowercase_codes, codes = list(lowercase_codes), list(codes)
+            self._model_prefix_index = lowercase_codes, codes
+        key = model.lower()
+        start = bisect_left(lowercase_codes, key)
+        position = bisect_left(codes, model, start, bisect_right(lowercase_codes, key, start))
+        if listed:
+            lowercase_codes.insert(position, key)
+            codes.insert(position, model)
+        elif position < len(codes) and codes[position] == model:
+            del codes[position]
+            del lowercase_codes[position]
+
+    def fuzzy_candidates(self, query_text, limit=FUZZY_LIMIT):
+        """
+        Returns ranked near-miss matches for a query that has no direct match, led by the
+        relaxed_candidate() if there is one.
+        """
+        version = self.data_version
+        cache_key = (query_text.strip().lower(), limit)
+        candidates = self.fuzzy_cache.get(version, cache_key)
+        if candidates is None:
+            candidates = self._search_fuzzy(query_text, limit)
+            self.fuzzy_cache.put(version, cache_key, candidates)
+        return candidates
+
+    def _search_fuzzy(self, query_text, limit):
+        relaxed = self.relaxed_candidate(query_text)
+        candidates = [relaxed] if relaxed is not None else []
+        seen = {relaxed['match']} if relaxed is not None else set()
+        # Ask for extra keys, since several aliases can point to the same name or model.
+        for key, score in self.fuzzy_index.search(query_text, limit * 2, FUZZY_BUDGET_MS / 1000):
+            alias_type, original_key = self.search_aliases[key]
+            if original_key in seen:
+                continue
+            seen.add(original_key)
+            candidates.append({'match': original_key, 'type': alias_type, 'score': score})
+            if len(candidates) >= limit:
+                break
+        return candidates
+
+    def resolve_batch_key(self, normalized_query):
+        """
+        Resolves one normalized batch line with a single alias lookup.
+        Returns (kind, items, related_names): kind is "models", "names" or None.
+        """
+        lookup_result = self.find_alias(normalized_query)
+        if lookup_result:
+            lookup_alias_type, canonical_key_string = lookup_result
+            if lookup_alias_type == "name":
+                models = self.canonical_name_to_internal_models.get(canonical_key_string)
+                if models:
+                    related_names = set()
+                    for model in models:
+                        related_names.update(self.internal_model_to_canonical_names.get(model, ()))
+                    return "models", sorted(models), related_names
+            elif lookup_alias_type == "model":
+                names = self.internal_model_to_canonical_names.get(canonical_key_string)
+                if names:
+                    return "names", sorted(names), set(names)
+        return None, [], set()
+
+    def iter_batch(self, queries, found_models, found_names, fuzzy=False):
+        """
+        Yields (original_query, kind, items, candidates) per non-empty line, resolving each
+        distinct normalized line only once, and collects the found models/names into the
+        given sets. candidates holds fuzzy matches for unmatched lines when fuzzy is set.
+        """
+        memo = {}
+        for query in queries:
+            original_query = query.strip()
+            if not original_query:
+                continue
+            normalized_query = original_query.lower()
+            resolved = memo.get(normalized_query)
+            if resolved is None:
+                kind, items, related_names = self.resolve_batch_key(normalized_query)
+                candidates = self.fuzzy_candidates(normalized_query) if fuzzy and kind is None else None
+                resolved = kind, items, related_names, candidates
+                if len(memo) < BATCH_MEMO_SIZE:
+                    memo[normalized_query] = resolved
+            kind, items, related_names, candidates = resolved
+            if kind == "models":
+                found_models.update(items)
+                found_names.update(related_names)
+            elif kind == "names":
+                found_names.update(related_names)
+                found_models.add(original_query)
+            yield original_query, kind, items, candidates
+
+    def format_batch(self, queries, output_format, fuzzy=False):
+        """
+        Resolves a list of batch lines and formats the result rows in one call, for worker pools.
+        Returns (output, found_models, found_names): output is a list of format_batch_line()
+        lines for the "lines" format and the finished text for "ndjson" and "csv".
+        """
+        found_models, found_names = set(), set()
+        rows = self.iter_batch(queries, found_models, found_names, fuzzy)
+        if output_format == 'lines':
+            output = [format_batch_line(*row) for row in rows]
+        elif output_format == 'ndjson':
+            output = "".join(format_ndjson_row(*row) + "\n" for row in rows)
+        else:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(csv_fields(*row, fuzzy) for row in rows)
+            output = buffer.getvalue()
+        return output, found_models, found_names
+
+
+def _source_digests(fingerprints):
+    """The content hashes of the source files, which (unlike mtimes) agree across machines."""
+    return sorted((filename, fingerprint['sha256']) for filename, fingerprint in fingerprints.items())
+
+
+def _manufacturer_index(manufacturers):
+    """
+    {lowercase manufacturer: (display name, sorted canonical names)}. Spellings that differ only
+    in case are merged under the one used for the most names.
+    """
+    spellings = {}
+    for manufacturer, names in manufacturers.items():
+        spellings.setdefault(manufacturer.lower(), []).append((len(names), manufacturer, names))
+    index = {}
+    for key, variants in spellings.items():
+        display_name = max(variants)[1]
+        index[key] = display_name, sorted({name for _, _, names in variants for name in names})
+    return index
+
+
+def format_batch_line(original_query, kind, items, candidates=None):
+    """The human-readable result line for one batch input, as shown by both front ends."""
+    if kind == "models":
+        return f"Input: '{original_query}' -> Models: {','.join(items)}"
+    if kind == "names":
+        return f"Input: '{original_query}' -> Names: {','.join(items)}"
+    if candidates:
+        return f"Input: '{original_query}' -> No direct match found. Did you mean '{candidates[0]['match']}'?"
+    return f"Input: '{original_query}' -> No direct match found."
+
+
+def format_ndjson_row(original_query, kind, items, candidates):
+    row = {'input': original_query, 'status': kind or 'not_found', 'items': items}
+    if candidates is not None:
+        row['candidates'] = candidates
+    return json.dumps(row)
+
+
+def format_ndjson_summary(found_models, found_names):
+    return json.dumps({'found_models': sorted(found_models), 'found_names': sorted(found_names)})
+
+
+def batch_json_payload(results_output, found_models, found_names):
+    """The body of a format=json batch response: the result lines and the models and names found."""
+    return {
+        'results_text': "\n".join(results_output),
+        'found_models': sorted(list(found_models)),
+        'found_names': sorted(list(found_names))
+    }
+
+
+def csv_header(fuzzy):
+    return ['input', 'status', 'items'] + (['did_you_mean'] if fuzzy else [])
+
+
+def csv_fields(original_query, kind, items, candidates, fuzzy):
+    row = [original_query, kind or 'not_found', ','.join(items)]
+    if fuzzy:
+        row.append(candidates[0]['match'] if candidates else '')
+    return row
@@ -1,27 +1,35 @@
 import sys
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,
-    QWidget, QLineEdit, QPushButton, QTextEdit, QLabel,
-    QCompleter
+    QWidget, QLineEdit, QPushButton, QTextEdit, QPlainTextEdit, QLabel,
+    QCompleter, QMessageBox, QFileDialog, QProgressBar
 )
-from PyQt6.QtCore import QStringListModel, Qt
-from collections import defaultdict
-import json
+from PyQt6.QtCore import QStringListModel, QThread, Qt, pyqtSignal
 import csv
+import json
 import os
+from device_index import DeviceIndex, csv_header, format_ndjson_summary
+from batch_lookup import input_format_for, iter_chunks, read_queries
 
 # --- Data Loading and Processing ---
-canonical_name_to_internal_models = defaultdict(set)
-internal_model_to_canonical_names = defaultdict(set)
-search_aliases = {}  # Maps normalized_query -> (type, original_string_key)
+index = None  # The shared lookup engine (device_index.py)
 
 # Global variables to store results for copying (sets ensure uniqueness)
 last_batch_models = set()
 last_batch_names = set()
 
+# How many autocomplete suggestions are fetched for the popup on each keystroke
+SUGGESTION_LIMIT = 20
+
+# Batch lines resolved (and shown) per step of a background batch lookup
+BATCH_CHUNK_LINES = 1000
+BATCH_INPUT_PLACEHOLDER = "Paste list here, e.g.:\niPhone 14 Pro Max\nSM-S908U\niPhone16,2"
+# Export format by file extension; other files get the result lines shown in the window
+EXPORT_FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
 
 def load_data():
-    """Loads and processes data from text files."""
+    """Loads and processes data from text files. Returns an error message, or None on success."""
 
     base_path = ""
     if hasattr(sys, '_MEIPASS'):
@@ -29,110 +37,132 @@ def load_data():
     else:
         base_path = os.path.dirname(os.path.abspath(__file__))
 
-    mapping_devices_path = os.path.join(base_path, 'mapping_devices.txt')
-    device_names_path = os.path.join(base_path, 'device_names.txt')
-    ios_device_mapping_path = os.path.join(base_path, 'mapping_ios_devices.txt')
-
+    global index
     try:
-        # Step 1: Process mapping_devices.txt (Android canonical names and models)
-        with open(mapping_devices_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        for entry in data:
-            manufacturer = entry[0].strip()
-            canonical_device_name = entry[1].strip()  # e.g., "Infinix SMART 8"
-
-            # Add canonical name as a 'name' type alias
-            search_aliases[canonical_device_name.lower()] = ("name", canonical_device_name)
-
-            # Add combined manufacturer + canonical name as a 'name' type alias
-            combined_name_by_manufacturer = f"{manufacturer} {canonical_device_name}".strip()
-            if combined_name_by_manufacturer.lower() != canonical_device_name.lower():
-                search_aliases[combined_name_by_manufacturer.lower()] = ("name", canonical_device_name)
-
-            # Add alias from entry[2] as a 'name' type alias
-            if len(entry) > 2 and entry[2]:
-                alias_from_entry2 = entry[2].strip()
-                if alias_from_entry2 and \
-                        alias_from_entry2.lower() != canonical_device_name.lower() and \
-                        search_aliases.get(alias_from_entry2.lower(), (None, None))[0] != "model" and \
-                        alias_from_entry2.lower() != combined_name_by_manufacturer.lower():
-                    search_aliases[alias_from_entry2.lower()] = ("name", canonical_device_name)
-
-            specific_internal_models = []
-            if len(entry) > 3:
-                specific_internal_models.extend([m.strip() for m in entry[3:] if m.strip()])
-
-            canonical_name_to_internal_models[canonical_device_name].update(specific_internal_models)
-
-            # Crucial: Add internal models as 'model' type aliases. This should prioritize over 'name' if conflict.
-            for model_code in specific_internal_models:  # e.g., "Infinix-X6525"
-                internal_model_to_canonical_names[model_code].add(canonical_device_name)
-                search_aliases[model_code.lower()] = ("model", model_code)
-
-        # Step 2: Process device_names.txt (additional aliases for existing names, sometimes models listed as names)
-        # This file's 'device_model' column (row[1]) contains device model strings but are really just names from other sources.
-        # We need to be careful if a string here overlaps with a real internal model code.
-        with open(device_names_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter='\t')
-            next(reader)  # Skip the header row
-            for row in reader:
-                if len(row) >= 2:
-                    make_from_file = row[0].strip()
-                    device_name_from_file = row[1].strip()  # This might be "Infinix X6525"
-
-                    normalized_dn = device_name_from_file.lower()
-
-                    # If this normalized string is already registered as a 'model' type, KEEP it as a 'model'.
-                    # Otherwise, add/update it as a 'name' type.
-                    if search_aliases.get(normalized_dn, (None, None))[0] != "model":
-                        search_aliases[normalized_dn] = ("name", device_name_from_file)
-
-                    combined_alias_from_file = f"{make_from_file} {device_name_from_file}".strip()
-                    if search_aliases.get(combined_alias_from_file.lower(), (None, None))[0] != "model":
-                        search_aliases[combined_alias_from_file.lower()] = ("name",
-                                                                            combined_alias_from_file)  # Use combined_alias_from_file as the key for better lookup in search_aliases
-
-        # Step 3: Process mapping_ios_devices.txt (iOS models and names)
-        with open(ios_device_mapping_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or ':' not in line or line.startswith(
-                        'device_model'):  # Skip header line 'device_model : device name'
-                    continue
-
-                parts = line.split(':', 1)
-                ios_model = parts[0].strip()  # e.g., "iPhone1,1"
-                ios_name = parts[1].strip()  # e.g., "iPhone"
-
-                if not ios_model or not ios_name:
-                    continue
-
-                canonical_name_to_internal_models[ios_name].add(ios_model)
-                internal_model_to_canonical_names[ios_model].add(ios_name)
-
-                # Add iOS name as a 'name' type alias
-                # Prioritize 'name' if already exists unless it's a 'model' already
-                if search_aliases.get(ios_name.lower(), (None, None))[0] != "model":
-                    search_aliases[ios_name.lower()] = ("name", ios_name)
-
-                # Add iOS model as a 'model' type alias. This should overwrite 'name' if conflict.
-                search_aliases[ios_model.lower()] = ("model", ios_model)
-
+        index = DeviceIndex.load(base_path)
         print("Data loaded successfully!")
     except FileNotFoundError as e:
-        print(f"Error loading data: {e}. Please ensure data files are located correctly in the bundle.")
-        sys.exit(1)
+        return f"Error loading data: {e}. Please ensure data files are located correctly in the bundle."
     except json.JSONDecodeError as e:
-        print(f"Error decoding JSON from 'mapping_devices.txt': {e}")
-        sys.exit(1)
+        return f"Error decoding JSON from 'mapping_devices.txt': {e}"
     except Exception as e:
-        print(f"Unexpected error during data loading: {e}")
-        sys.exit(1)
-
-
-# Load data when the script starts
-load_data()
+        return f"Unexpected error during data loading: {e}"
+    return None
+
+
+class DataLoader(QThread):
+    """
+    Runs load_data() off the GUI thread, so the window shows at once while the tables and
+    the suggestion index are built. Emits finished_loading with the error message, or "".
+    """
+    finished_loading = pyqtSignal(str)
+
+    def run(self):
+        self.finished_loading.emit(load_data() or "")
+
+
+class SuggestionCompleter(QCompleter):
+    """
+    Autocomplete backed by the suggestion index: on every edit the model is replaced with the
+    top matches for the text, ranked by the index, instead of Qt filtering every suggestion.
+    """
+
+    def __init__(self, line_edit, limit=SUGGESTION_LIMIT):
+        super().__init__(line_edit)
+        self.limit = limit
+        self.setModel(QStringListModel(self))
+        # The model already holds just the matches, best first; Qt must not filter or re-sort it.
+        self.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        line_edit.setCompleter(self)
+        line_edit.textEdited.connect(self.update_suggestions)
+
+    def update_suggestions(self, text):
+        suggestions = index.suggest(text, self.limit) if index is not None and text.strip() else []
+        self.model().setStringList(suggestions)
+        if suggestions:
+            self.complete()
+        else:
+            self.popup().hide()
+
+
+class BatchWorker(QThread):
+    """
+    Runs a batch lookup off the GUI thread, BATCH_CHUNK_LINES lines at a time, until done or
+    until requestInterruption() is called. The input is a list of lines or a text/CSV/TSV
+    file; the results are either emitted for display or written to output_path.
+    Emits total_known(lines) first, then chunk_done(result_text, models, names, lines_done)
+    per chunk (result_text is empty when writing to a file), then finished_batch(error or "").
+    """
+    total_known = pyqtSignal(int)
+    chunk_done = pyqtSignal(str, object, object, int)
+    finished_batch = pyqtSignal(str)
+
+    def __init__(self, parent, input_lines=None, input_path=None, output_path=None):
+        super().__init__(parent)
+        self.input_lines = input_lines
+        self.input_path = input_path
+        self.output_path = output_path
+        self.lines_done = 0
+        # Set when the batch stopped early; isInterruptionRequested() is reset once the thread ends.
+        self.cancelled = False
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            # An exception escaping a QThread aborts the whole application, so every failure
+            # (unreadable file, malformed CSV, bad column) is reported through finished_batch.
+            self.finished_batch.emit(str(e) or type(e).__name__)
+        else:
+            self.finished_batch.emit("")
+
+    def _run(self):
+        input_stream = output_stream = None
+        try:
+            if self.input_lines is not None:
+                self.total_known.emit(len(self.input_lines))
+                queries = self.input_lines
+            else:
+                self.total_known.emit(_count_lines(self.input_path))
+                input_stream = open(self.input_path, encoding='utf-8', newline='')
+                queries = read_queries(input_stream, input_format_for(self.input_path))
+            output_format = 'lines'
+            if self.output_path:
+                output_format = EXPORT_FORMATS.get(os.path.splitext(self.output_path)[1].lower(), 'lines')
+                output_stream = open(self.output_path, 'w', encoding='utf-8', newline='')
+                if output_format == 'csv':
+                    csv.writer(output_stream).writerow(csv_header(False))
+            all_models, all_names = set(), set()
+            for chunk in iter_chunks(queries, BATCH_CHUNK_LINES):
+                if self.isInterruptionRequested():
+                    self.cancelled = True
+                    return
+                output, found_models, found_names = index.format_batch(chunk, output_format)
+                self.lines_done += len(chunk)
+                if output_stream is None:
+                    self.chunk_done.emit("\n".join(output), found_models, found_names, self.lines_done)
+                    continue
+                output_stream.write("".join(line + "\n" for line in output) if output_format == 'lines' else output)
+                all_models.update(found_models)
+                all_names.update(found_names)
+                self.chunk_done.emit("", found_models, found_names, self.lines_done)
+            if output_format == 'ndjson':
+                output_stream.write(format_ndjson_summary(all_models, all_names) + "\n")
+        finally:
+            if input_stream is not None:
+                input_stream.close()
+            if output_stream is not None:
+                output_stream.close()
+
+
+def _count_lines(path):
+    """Counts the lines of a file without decoding it, for the progress bar."""
+    lines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return lines
 
 
 # --- PyQt6 Application ---
@@ -154,24 +184,8 @@ class DeviceLookupApp(QMainWindow):
         self.input_field.setPlaceholderText("e.g., iPhone 15 Pro Max or iPhone16,2")
         self.layout.addWidget(self.input_field)
 
-        # Autocomplete Setup
-        self.completer = QCompleter(self)
-        self.completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-
-        all_suggestions = set()
-        # Collect all original keys that are names from search_aliases
-        for normalized_key, (key_type, original_key) in search_aliases.items():
-            if key_type == "name":
-                all_suggestions.add(original_key)
-            elif key_type == "model":
-                all_suggestions.add(original_key)  # Also add original model strings for autocompletion
-
-        suggestions_list = sorted(list(all_suggestions))
-
-        model = QStringListModel()
-        model.setStringList(suggestions_list)
-        self.completer.setModel(model)
-        self.input_field.setCompleter(self.completer)
+        # Autocomplete Setup (suggestions appear once the data has loaded)
+        self.completer = SuggestionCompleter(self.input_field)
 
         # Single Lookup Buttons
         self.single_button_layout = QHBoxLayout()
@@ -201,17 +215,37 @@ class DeviceLookupApp(QMainWindow):
         self.layout.addWidget(QLabel("\n--- Batch Device Lookup ---"))
         self.batch_input_label = QLabel("Enter device names or models (one per line):")
         self.layout.addWidget(self.batch_input_label)
-        self.batch_input_field = QTextEdit()
-        self.batch_input_field.setPlaceholderText("Paste list here, e.g.:\niPhone 14 Pro Max\nSM-S908U\niPhone16,2")
+        # Plain text: a QTextEdit lays out a long pasted list in the background, and that layout
+        # stalls the window while it competes with a running batch for the GIL.
+        self.batch_input_field = QPlainTextEdit()
+        self.batch_input_field.setPlaceholderText(BATCH_INPUT_PLACEHOLDER)
         self.batch_input_field.setFixedHeight(120)
         self.layout.addWidget(self.batch_input_field)
 
+        # Big lists can be read from a file instead of being pasted
+        self.batch_input_path = None
+        self.batch_file_layout = QHBoxLayout()
+        self.import_button = QPushButton("Import List from File...")
+        self.import_button.clicked.connect(self.import_batch_file)
+        self.batch_file_layout.addWidget(self.import_button)
+
+        self.export_button = QPushButton("Run Batch to File...")
+        self.export_button.clicked.connect(self.export_batch_results)
+        self.batch_file_layout.addWidget(self.export_button)
+
+        self.layout.addLayout(self.batch_file_layout)
+
         # Batch Lookup Buttons
         self.batch_button_layout = QHBoxLayout()
         self.batch_lookup_button = QPushButton("Run Batch Lookup")
         self.batch_lookup_button.clicked.connect(self.batch_lookup)
         self.batch_button_layout.addWidget(self.batch_lookup_button)
 
+        self.cancel_batch_button = QPushButton("Cancel")
+        self.cancel_batch_button.setEnabled(False)
+        self.cancel_batch_button.clicked.connect(self.cancel_batch)
+        self.batch_button_layout.addWidget(self.cancel_batch_button)
+
         self.copy_models_button = QPushButton("Copy All Found Models")
         self.copy_models_button.clicked.connect(self.copy_models_to_clipboard)
         self.batch_button_layout.addWidget(self.copy_models_button)
@@ -229,11 +263,47 @@ class DeviceLookupApp(QMainWindow):
         # Batch Lookup Result Display
         self.batch_result_label = QLabel("Batch Search Results:")
         self.layout.addWidget(self.batch_result_label)
-        self.batch_result_display = QTextEdit()
+        # A plain text view appends each chunk of results without re-laying out the whole text
+        self.batch_result_display = QPlainTextEdit()
         self.batch_result_display.setReadOnly(True)
         self.layout.addWidget(self.batch_result_display)
+        self.batch_worker = None
+        self.batch_progress = QProgressBar()
+        self.batch_progress.setVisible(False)
+        self.statusBar().addPermanentWidget(self.batch_progress)
 
         # Status Bar / Data Update Info
+        # The lookup buttons wait for the data, which loads in the background once the window shows.
+        self.lookup_buttons = [self.search_model_button, self.search_name_button, self.batch_lookup_button,
+                               self.export_button]
+        for button in self.lookup_buttons:
+            button.setEnabled(False)
+        self.statusBar().showMessage("Loading data...")
+        self.data_loader = DataLoader(self)
+        self.data_loader.finished_loading.connect(self.on_data_loaded)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if index is None and not self.data_loader.isRunning():
+            self.data_loader.start()
+
+    def closeEvent(self, event):
+        # Qt aborts if a running QThread is destroyed, and a load can't be interrupted: wait for it.
+        self.data_loader.wait()
+        if self.batch_worker is not None:
+            self.batch_worker.requestInterruption()
+            self.batch_worker.wait()
+        super().closeEvent(event)
+
+    def on_data_loaded(self, error):
+        """Enables the lookups once the data has loaded, or reports why it couldn't be loaded."""
+        if error:
+            print(error)
+            QMessageBox.critical(self, "Device Model Lookup", error)
+            QApplication.instance().exit(1)
+            return
+        for button in self.lookup_buttons:
+            button.setEnabled(True)
         self.statusBar().showMessage("Data loaded. Ready.")
 
     def _perform_single_lookup_logic(self, query_text, search_type):
@@ -241,36 +311,7 @@ class DeviceLookupApp(QMainWindow):
         Performs the core lookup logic for a single query.
         Returns a tuple: (result_type, list_of_found_items, message_for_user)
         """
-        normalized_query = query_text.strip().lower()
-        if not normalized_query:
-            return "error", [], "Empty query."
-
-        lookup_result = search_aliases.get(normalized_query)
-
-        if lookup_result:
-            lookup_alias_type, canonical_key_string = lookup_result  # Renamed 'key' to 'canonical_key_string' for clarity
-
-            if search_type == "model":  # User wants models (Name -> Model)
-                if lookup_alias_type == "name":
-                    models = canonical_name_to_internal_models.get(canonical_key_string)
-                    if models:
-                        return "success", sorted(list(models)), f"Models for '{canonical_key_string}':"
-                    else:
-                        return "not_found", [], f"No internal models found for '{canonical_key_string}'."
-                elif lookup_alias_type == "model":
-                    return "info", [], f"'{query_text}' is an internal model. Use 'Search Name' to find its name(s)."
-
-            elif search_type == "name":  # User wants names (Model -> Name)
-                if lookup_alias_type == "model":
-                    names = internal_model_to_canonical_names.get(canonical_key_string)
-                    if names:
-                        return "success", sorted(list(names)), f"Names for internal model '{canonical_key_string}':"
-                    else:
-                        return "not_found", [], f"No device names found for internal model '{canonical_key_string}'."
-                elif lookup_alias_type == "name":
-                    return "info", [], f"'{query_text}' is a device name. Use 'Search Model' to find its internal model(s)."
-
-        return "not_found", [], f"No direct match found for '{query_text}'."
+        return index.lookup(query_text, search_type)
 
     def handle_single_lookup(self, search_type):
         """Handles single lookup requests from the UI."""
@@ -286,46 +327,90 @@ class DeviceLookupApp(QMainWindow):
             self.result_display.setText(message)
 
     def batch_lookup(self):
-        """Performs batch lookup from the batch_input_field."""
-        global last_batch_models, last_batch_names
-        last_batch_models.clear()
-        last_batch_names.clear()
-
-        input_lines = self.batch_input_field.toPlainText().strip().split('\n')
-
-        if not any(line.strip() for line in input_lines):
-            self.batch_result_display.setText("Batch input is empty. Please enter device names or models.")
-            self.statusBar().showMessage("Batch lookup failed: Empty input.")
+        """Runs the batch lookup of the imported file or the batch_input_field, showing the results."""
+        self._start_batch()
+
+    def export_batch_results(self):
+        """Runs the batch lookup straight into a file: .csv, .ndjson/.jsonl, or text lines otherwise."""
+        output_path, _ = QFileDialog.getSaveFileName(self, "Save Batch Results", "batch_results.txt",
+                                                     "Text (*.txt);;CSV (*.csv);;NDJSON (*.ndjson)")
+        if output_path:
+            self._start_batch(output_path)
+
+    def import_batch_file(self):
+        """Uses a text (one query per line), CSV or TSV file (first column) as the batch input."""
+        input_path, _ = QFileDialog.getOpenFileName(self, "Import Device List", "",
+                                                    "Lists (*.txt *.csv *.tsv);;All Files (*)")
+        if not input_path:
             return
+        self.batch_input_path = input_path
+        self.batch_input_field.clear()
+        self.batch_input_field.setReadOnly(True)
+        self.batch_input_field.setPlaceholderText(f"Using {input_path}\n(Clear Batch Search to type a list instead)")
+        self.statusBar().showMessage(f"Imported {os.path.basename(input_path)}. Run the batch lookup.")
 
-        results_output = []
-
-        for line_num, line in enumerate(input_lines):
-            original_query = line.strip()
-            if not original_query:
-                continue
-
-            # First, try to identify it as a canonical name and get models
-            status_model, models_found, msg_model = self._perform_single_lookup_logic(original_query, "model")
-
-            # Second, if not found as a name, try to identify it as a model and get names
-            status_name, names_found, msg_name = self._perform_single_lookup_logic(original_query, "name")
-
-            if status_model == "success":
-                results_output.append(f"Input: '{original_query}' -> Models: {','.join(models_found)}")
-                last_batch_models.update(models_found)
-                for model in models_found:
-                    last_batch_names.update(internal_model_to_canonical_names.get(model, set()))
-            elif status_name == "success":
-                results_output.append(f"Input: '{original_query}' -> Names: {','.join(names_found)}")
-                last_batch_names.update(names_found)
-                last_batch_models.add(original_query)  # Add the original model string to the models set
-            else:
-                results_output.append(f"Input: '{original_query}' -> No direct match found. ({msg_model} / {msg_name})")
+    def _start_batch(self, output_path=None):
+        global last_batch_models, last_batch_names
+        input_lines = None
+        if self.batch_input_path is None:
+            input_lines = self.batch_input_field.toPlainText().strip().split('\n')
+            if not any(line.strip() for line in input_lines):
+                self.batch_result_display.setPlainText("Batch input is empty. Please enter device names or models.")
+                self.statusBar().showMessage("Batch lookup failed: Empty input.")
+                return
 
-        self.batch_result_display.setText("\n".join(results_output))
-        self.statusBar().showMessage(
-            f"Batch lookup complete. Found {len(last_batch_models)} unique models and {len(last_batch_names)} unique names.")
+        last_batch_models.clear()
+        last_batch_names.clear()
+        self.batch_result_display.clear()
+        if self.batch_worker is not None:
+            # The previous worker has emitted its last signal; wait() only lets its thread exit.
+            self.batch_worker.wait()
+            self.batch_worker.deleteLater()
+        if output_path:
+            self.batch_result_display.setPlainText(f"Writing results to {output_path}...")
+        self.batch_worker = BatchWorker(self, input_lines, self.batch_input_path, output_path)
+        self.batch_worker.total_known.connect(self.batch_progress.setMaximum)
+        self.batch_worker.chunk_done.connect(self.on_batch_chunk)
+        self.batch_worker.finished_batch.connect(self.on_batch_finished)
+        self._set_batch_running(True)
+        self.statusBar().showMessage("Batch lookup running...")
+        self.batch_worker.start()
+
+    def _set_batch_running(self, running):
+        for button in (self.batch_lookup_button, self.export_button, self.import_button, self.clear_batch_button):
+            button.setEnabled(not running)
+        self.cancel_batch_button.setEnabled(running)
+        self.batch_progress.setValue(0)
+        self.batch_progress.setVisible(running)
+
+    def on_batch_chunk(self, result_text, found_models, found_names, lines_done):
+        """Shows one chunk of results; the copy buttons already include its models and names."""
+        last_batch_models.update(found_models)
+        last_batch_names.update(found_names)
+        if result_text:
+            self.batch_result_display.appendPlainText(result_text)
+        self.batch_progress.setValue(min(lines_done, self.batch_progress.maximum()))
+
+    def cancel_batch(self):
+        if self.batch_worker is not None:
+            self.batch_worker.requestInterruption()
+            self.cancel_batch_button.setEnabled(False)
+            self.statusBar().showMessage("Cancelling batch lookup...")
+
+    def on_batch_finished(self, error):
+        worker = self.batch_worker
+        self._set_batch_running(False)
+        found = f"Found {len(last_batch_models)} unique models and {len(last_batch_names)} unique names."
+        if error:
+            self.statusBar().showMessage(f"Batch lookup failed after {worker.lines_done} lines: {error}")
+        elif worker.cancelled:
+            self.statusBar().showMessage(f"Batch lookup cancelled after {worker.lines_done} lines. {found}")
+        elif worker.output_path:
+            self.batch_result_display.setPlainText(f"Results of {worker.lines_done} lines written to "
+                                                   f"{worker.output_path}.")
+            self.statusBar().showMessage(f"Batch lookup complete. {found}")
+        else:
+            self.statusBar().showMessage(f"Batch lookup complete. {found}")
 
     def copy_models_to_clipboard(self):
         """Copies all found internal models from the last batch lookup to the clipboard."""
@@ -360,6 +445,9 @@ class DeviceLookupApp(QMainWindow):
     def clear_batch_search(self):
         """Clears the batch search input and results."""
         global last_batch_models, last_batch_names
+        self.batch_input_path = None
+        self.batch_input_field.setReadOnly(False)
+        self.batch_input_field.setPlaceholderText(BATCH_INPUT_PLACEHOLDER)
         self.batch_input_field.clear()
         self.batch_result_display.clear()
         last_batch_models.clear()
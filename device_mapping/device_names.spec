@@ -1,11 +1,19 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# Bundle the compiled snapshot too when it has been built (python lookup_tables.py),
+# and the delta files, which device_index.py applies on top of the base tables.
+datas = [('mapping_devices.txt', '.'), ('device_names.txt', '.'), ('mapping_ios_devices.txt', '.')]
+if os.path.exists('lookup_tables.snapshot'):
+    datas.append(('lookup_tables.snapshot', '.'))
+if os.path.isdir('deltas'):
+    datas.append(('deltas', 'deltas'))
 
 a = Analysis(
     ['device_names.py'],
     pathex=[],
     binaries=[],
-    datas=[('mapping_devices.txt', '.'), ('device_names.txt', '.'), ('mapping_ios_devices.txt', '.')],
+    datas=datas,
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
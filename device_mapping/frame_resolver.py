@@ -0,0 +1,174 @@
+"""
+Vectorized lookups for analytics pipelines: resolves a pandas Series or a
+NumPy array of device strings into aligned result columns.
+
+    from frame_resolver import resolve_series
+    events = events.join(resolve_series(events['device']))
+
+Rows are never looked up one by one. The column is factorized into its
+distinct values, each distinct value is resolved once against the same
+DeviceIndex that app.py serves, and every result column is spread back to
+the rows with a single take(). A 50M-row column with 100k distinct values
+costs 100k lookups plus a few vectorized passes over the rows.
+
+Result columns (None / missing where the value has no match):
+
+    match_type      "name" or "model": what the value matched
+    canonical_name  the canonical name; for a model with several names, the first one
+    names           tuple of all canonical names of the match
+    models          tuple of the internal models of the match; empty for names that
+                    only appear in device_names.txt, which /lookup reports as not found
+    manufacturer    the manufacturer of canonical_name, if known
+
+pandas is optional: without it, resolve_array() still works on NumPy arrays
+and returns a dict of arrays.
+"""
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+from device_index import DeviceIndex
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+MATCH_TYPES = ("name", "model")
+COLUMNS = ('match_type', 'canonical_name', 'names', 'models', 'manufacturer')
+
+_default_index = None
+
+
+def default_index(store='dict'):
+    """The DeviceIndex loaded from this directory, loaded on first use and then reused."""
+    global _default_index
+    if _default_index is None:
+        _default_index = DeviceIndex.load(BASE_PATH, store)
+    return _default_index
+
+
+def _manufacturer_by_name(index):
+    by_name = {}
+    for manufacturer, _ in index.manufacturers():
+        _, _, names = index.manufacturer_names(manufacturer)
+        for name in names:
+            by_name.setdefault(name, manufacturer)
+    return by_name
+
+
+def resolve_values(values, index=None):
+    """
+    Resolves distinct values once each. Returns (match_codes, columns): match_codes holds, per
+    value, the position of its match type in MATCH_TYPES or -1, and columns maps the object
+    columns of COLUMNS to lists aligned with values. Values that normalize to the same
+    lowercase key share one lookup.
+    """
+    if index is None:
+        index = default_index()
+    manufacturer_by_name = _manufacturer_by_name(index)
+    memo = {}
+    match_codes = []
+    columns = {name: [] for name in COLUMNS if name != 'match_type'}
+    for value in values:
+        key = value.strip().lower() if isinstance(value, str) else None
+        resolved = memo.get(key)
+        if resolved is None:
+            resolved = memo[key] = _resolve_key(index, key, manufacturer_by_name)
+        match_codes.append(resolved[0])
+        for name, column_value in zip(columns, resolved[1:]):
+            columns[name].append(column_value)
+    return match_codes, columns
+
+
+def _resolve_key(index, key, manufacturer_by_name):
+    lookup_result = index.find_alias(key) if key else None
+    if lookup_result:
+        alias_type, canonical_key = lookup_result
+        if alias_type == "name":
+            names = (canonical_key,)
+            models = tuple(sorted(index.canonical_name_to_internal_models.get(canonical_key) or ()))
+        else:
+            names = tuple(sorted(index.internal_model_to_canonical_names.get(canonical_key) or ()))
+            models = (canonical_key,)
+        manufacturer = next((manufacturer_by_name[name] for name in names if name in manufacturer_by_name), None)
+        return MATCH_TYPES.index(alias_type), names[0] if names else None, names, models, manufacturer
+    return -1, None, None, None, None
+
+
+def _factorize(values):
+    """(codes, uniques) with code -1 for missing values; pandas' hash factorize when available."""
+    if pd is not None:
+        return pd.factorize(values, use_na_sentinel=True)
+    if values.dtype == object:
+        # np.unique sorts, so None and other non-strings can't be mixed with the strings.
+        values = np.array([value if isinstance(value, str) else '' for value in values], dtype=object)
+    uniques, codes = np.unique(values, return_inverse=True)
+    return codes.reshape(-1), uniques
+
+
+def _take(items, codes):
+    """items[code] for every code, with None for code -1."""
+    array = np.empty(len(items) + 1, dtype=object)
+    array[:-1] = items
+    # The extra None at the end is what take() returns for -1.
+    return array.take(codes)
+
+
+def resolve_array(values, index=None):
+    """
+    Resolves a 1-D NumPy array (or any sequence) of device strings.
+    Returns {column: array aligned with values}; match_type is an object array of "name"/"model"/None.
+    """
+    if np is None:
+        raise ImportError("resolve_array() needs NumPy: pip install numpy")
+    values = np.asarray(values, dtype=object) if not isinstance(values, np.ndarray) else values
+    codes, uniques = _factorize(values.ravel())
+    match_codes, columns = resolve_values(list(uniques), index)
+    result = {name: _take(items, codes) for name, items in columns.items()}
+    result['match_type'] = _take([MATCH_TYPES[code] if code >= 0 else None for code in match_codes], codes)
+    return {name: result[name].reshape(values.shape) for name in COLUMNS}
+
+
+def resolve_series(series, index=None):
+    """
+    Resolves a pandas Series of device strings. Returns a DataFrame with the same index and
+    one column per entry of COLUMNS; match_type and manufacturer are categoricals.
+    """
+    if pd is None:
+        raise ImportError("resolve_series() needs pandas: pip install pandas")
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    match_codes, columns = resolve_values(list(uniques), index)
+    # Categorical codes are looked up per distinct value and then taken per row, like the other columns.
+    manufacturer_codes, manufacturers = pd.factorize(pd.Series(columns['manufacturer'], dtype=object))
+    return pd.DataFrame({
+        'match_type': pd.Categorical.from_codes(_take_codes(match_codes, codes), categories=list(MATCH_TYPES)),
+        'canonical_name': _take(columns['canonical_name'], codes),
+        'names': _take(columns['names'], codes),
+        'models': _take(columns['models'], codes),
+        'manufacturer': pd.Categorical.from_codes(_take_codes(manufacturer_codes, codes), categories=manufacturers),
+    }, index=series.index)
+
+
+def _take_codes(unique_codes, codes):
+    return np.append(np.asarray(unique_codes, dtype=np.int32), -1).take(codes)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    index = default_index()
+    sample = list(index.all_suggestions)[:50_000] + ["unknown device", None]
+    column = pd.Series(np.random.default_rng(0).choice(np.array(sample, dtype=object), rows))
+    started = time.perf_counter()
+    resolved = resolve_series(column, index)
+    seconds = time.perf_counter() - started
+    print(f"Resolved {rows:,} rows ({len(sample):,} distinct values) in {seconds:.2f}s")
+    print(resolved['match_type'].value_counts(dropna=False).to_string())
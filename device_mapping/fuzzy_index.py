@@ -0,0 +1,134 @@
+"""
+Near-miss matching over the alias keys: trigram candidate generation
+followed by bounded edit-distance verification.
+
+Every search runs against a deadline, so one odd query can only cost a
+fixed amount of time no matter how many keys share its trigrams.
+"""
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+_NGRAM = 3
+_PAD = ' '
+# Candidates passed to the edit-distance check, best trigram overlap first.
+MAX_VERIFIED_CANDIDATES = 200
+
+
+def _grams(text):
+    padded = f"{_PAD}{text}{_PAD}"
+    return {padded[i:i + _NGRAM] for i in range(len(padded) - _NGRAM + 1)}
+
+
+def _max_distance(length):
+    """Edits allowed for a query of the given length."""
+    return 1 if length <= 8 else 2
+
+
+def bounded_edit_distance(a, b, max_distance):
+    """
+    Returns the edit distance between a and b, counting an adjacent
+    transposition as one edit, or None if it exceeds max_distance.
+    Only the diagonal band of width max_distance is computed.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = max_distance + 1
+    before_previous = None
+    previous = [i if i <= max_distance else too_far for i in range(len(a) + 1)]
+    for j in range(1, len(b) + 1):
+        char_b = b[j - 1]
+        current = [too_far] * (len(a) + 1)
+        current[0] = row_min = j if j <= max_distance else too_far
+        for i in range(max(1, j - max_distance), min(len(a), j + max_distance) + 1):
+            char_a = a[i - 1]
+            best = min(previous[i - 1] + (char_a != char_b), current[i - 1] + 1, previous[i] + 1)
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                best = min(best, before_previous[i - 2] + 1)
+            current[i] = best
+            if best < row_min:
+                row_min = best
+        if row_min > max_distance:
+            return None
+        before_previous, previous = previous, current
+    distance = previous[-1]
+    return distance if distance <= max_distance else None
+
+
+class FuzzyIndex:
+    """Trigram index over lowercase alias keys, built once at load time."""
+
+    def __init__(self, keys):
+        # Ids follow key length, so every posting list is also ordered by length
+        # and the keys of a given length range are one slice of it.
+        self._keys = sorted(keys, key=lambda key: (len(key), key))
+        self._lengths = [len(key) for key in self._keys]
+        grams = {}
+        for key_id, key in enumerate(self._keys):
+            for gram in _grams(key):
+                postings = grams.get(gram)
+                if postings is None:
+                    grams[gram] = [key_id]
+                else:
+                    postings.append(key_id)
+        self._grams = {gram: array('I', postings) for gram, postings in grams.items()}
+        # Keys added after the build (delta updates) are checked linearly; removed ones are skipped.
+        self._extra_keys = []
+        self._removed = set()
+
+    def __len__(self):
+        return len(self._keys) + len(self._extra_keys) - len(self._removed)
+
+    def add(self, key):
+        if key in self._removed:
+            self._removed.discard(key)
+        else:
+            self._extra_keys.append(key)
+
+    def discard(self, key):
+        self._removed.add(key)
+
+    def search(self, query, limit=5, budget_seconds=0.02):
+        """
+        Returns up to `limit` (key, score) pairs for keys within a small edit
+        distance of query, best first. Score is 1 - distance / longer length.
+        Stops and returns what it has once budget_seconds have elapsed.
+        """
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+        deadline = time.perf_counter() + budget_seconds
+        max_distance = _max_distance(len(query))
+        first_id = bisect_left(self._lengths, len(query) - max_distance)
+        end_id = bisect_right(self._lengths, len(query) + max_distance)
+
+        query_grams = _grams(query)
+        overlap = Counter()
+        for gram in query_grams:
+            postings = self._grams.get(gram)
+            if postings is None:
+                continue
+            overlap.update(postings[bisect_left(postings, first_id):bisect_left(postings, end_id)])
+            if time.perf_counter() > deadline:
+                break
+
+        # An edit breaks at most n trigrams and a transposition n + 1 (q-gram lemma).
+        min_overlap = max(1, len(query_grams) - max_distance * (_NGRAM + 1))
+        matches = []
+        candidates = [self._keys[key_id] for key_id, shared in overlap.most_common(MAX_VERIFIED_CANDIDATES)
+                      if shared >= min_overlap]
+        candidates.extend(self._extra_keys)
+        for key in candidates:
+            if time.perf_counter() > deadline:
+                break
+            if key in self._removed:
+                continue
+            distance = bounded_edit_distance(query, key, max_distance)
+            if distance is not None:
+                matches.append((distance, len(key), key))
+        matches.sort()
+        return [(key, round(1 - distance / max(len(query), len(key)), 3))
+                for distance, _, key in matches[:limit]]
@@ -0,0 +1,408 @@
+"""
+Compact in-memory lookup tables: every string is stored once and referred to by id.
+
+The encoding is the one the snapshot file uses. All strings are kept in one
+sorted list. An alias maps to an int holding the target's string id with
+the alias type in the low bit, instead of a ("name", X) tuple. Each relation
+is three arrays: sorted key ids, offsets, and value ids (CSR). Only the
+alias keys and the string list are Python objects; the relations hold no
+per-entry objects at all, so they also stay shared between forked workers.
+
+The tables keep the mapping interface of the plain dicts they replace.
+search_aliases.get() returns (type, original_string_key) and the relations
+return tuples, as the mmap views do. They accept the in-place updates done by
+apply_delta_ops(): new strings are appended to the pool, and changed
+relation entries go to a small overlay on top of the arrays.
+"""
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+
+ALIAS_IS_MODEL = 1
+NORMALIZED_IS_RELAXED = 1
+_ALIAS_TYPES = ("name", "model")
+_NOT_A_KEY = 0xFFFFFFFF
+# The {string: ids} tables of a suggestion index and the snapshot sections they are stored in
+SUGGESTION_ID_LISTS = (
+    ('grams', 'suggestion_gram'),
+    ('top_prefixes', 'suggestion_top_prefix'),
+    ('top_tokens', 'suggestion_top_token'),
+)
+
+
+def model_sort_key(code):
+    """The order of the model codes behind prefix queries: by lowercase form, then as written."""
+    return code.lower(), code
+
+
+def encode_tables(search_aliases, canonical_name_to_internal_models, internal_model_to_canonical_names,
+                  alias_weights=None, manufacturers=None, normalized_keys=None, suggestions=None):
+    """
+    Interns every string of the tables and encodes them as id arrays.
+    Returns (strings, sections): strings is sorted by UTF-8 bytes (the same order as Python's
+    str comparison), and sections holds the alias_*, CSR and derived index arrays named as in
+    the snapshot. normalized_keys is {normalized_key: (alias_key, relaxed)} (normalizer.py) and
+    suggestions the output of build_suggestion_tables() (suggest_index.py).
+    """
+    alias_weights = alias_weights or {}
+    manufacturers = manufacturers or {}
+    normalized_keys = normalized_keys or {}
+    model_codes = sorted(internal_model_to_canonical_names, key=model_sort_key)
+    strings = set(search_aliases)
+    strings.update(original_key for _, original_key in search_aliases.values())
+    strings.update(canonical_name_to_internal_models)
+    strings.update(internal_model_to_canonical_names)
+    strings.update(manufacturers)
+    for names in manufacturers.values():
+        strings.update(names)
+    strings.update(normalized_keys)
+    strings.update(code.lower() for code in model_codes)
+    if suggestions:
+        strings.update(suggestions['lowered'])
+        strings.update(suggestions['token_keys'])
+        strings.update(suggestions['grams'])
+        strings.update(suggestions['top_prefixes'])
+        strings.update(suggestions['top_tokens'])
+    strings = sorted(strings)
+    string_ids = {s: string_id for string_id, s in enumerate(strings)}
+
+    sections = {}
+    alias_keys = sorted(search_aliases)
+    sections['alias_keys'] = array('I', (string_ids[key] for key in alias_keys))
+    sections['alias_values'] = array('I', (
+        (string_ids[search_aliases[key][1]] << 1) | (ALIAS_IS_MODEL if search_aliases[key][0] == "model" else 0)
+        for key in alias_keys
+    ))
+    sections['alias_weights'] = array('I', (min(alias_weights.get(key, 0), 0xFFFFFFFF) for key in alias_keys))
+    sections['name_keys'], sections['name_offsets'], sections['name_models'] = \
+        _csr(canonical_name_to_internal_models, string_ids)
+    sections['model_keys'], sections['model_offsets'], sections['model_names'] = \
+        _csr(internal_model_to_canonical_names, string_ids)
+    sections['maker_keys'], sections['maker_offsets'], sections['maker_names'] = _csr(manufacturers, string_ids)
+    normalized = sorted(normalized_keys)
+    sections['normalized_keys'] = array('I', (string_ids[key] for key in normalized))
+    sections['normalized_aliases'] = array('I', (
+        (string_ids[normalized_keys[key][0]] << 1) | (NORMALIZED_IS_RELAXED if normalized_keys[key][1] else 0)
+        for key in normalized
+    ))
+    sections['model_prefix_keys'] = array('I', (string_ids[code.lower()] for code in model_codes))
+    sections['model_prefix_codes'] = array('I', (string_ids[code] for code in model_codes))
+    if suggestions:
+        sections.update(_encode_suggestions(suggestions, string_ids))
+    return strings, sections
+
+
+def _encode_suggestions(suggestions, string_ids):
+    sections = {
+        'suggestion_strings': array('I', (string_ids[s] for s in suggestions['strings'])),
+        'suggestion_lowered': array('I', (string_ids[s] for s in suggestions['lowered'])),
+        'suggestion_weights': array('I', (min(weight, 0xFFFFFFFF) for weight in suggestions['weights'])),
+        'suggestion_ranks': array('I', suggestions['ranks']),
+        'suggestion_token_keys': array('I', (string_ids[token] for token in suggestions['token_keys'])),
+        'suggestion_token_ids': array('I', suggestions['token_ids']),
+    }
+    for name, prefix in SUGGESTION_ID_LISTS:
+        sections[prefix + '_keys'], sections[prefix + '_offsets'], sections[prefix + '_ids'] = \
+            _id_lists(suggestions[name], string_ids)
+    return sections
+
+
+def _id_lists(lists, string_ids):
+    """Encodes {key: sequence of ints} as sorted key ids plus offset/value arrays, keeping each value order."""
+    key_ids, offsets, values = array('I'), array('I', [0]), array('I')
+    for key in sorted(lists):
+        key_ids.append(string_ids[key])
+        values.extend(lists[key])
+        offsets.append(len(values))
+    return key_ids, offsets, values
+
+
+def _csr(relation, string_ids):
+    """Encodes {key: set(values)} as sorted keys plus offset/value arrays."""
+    key_ids, offsets, values = array('I'), array('I', [0]), array('I')
+    for key in sorted(relation):
+        key_ids.append(string_ids[key])
+        values.extend(sorted(string_ids[value] for value in relation[key]))
+        offsets.append(len(values))
+    return key_ids, offsets, values
+
+
+def relation_dict(string, key_ids, offsets, value_ids):
+    """Decodes a small CSR relation into {key: tuple of values}; string(id) returns the string for an id."""
+    return {string(key_id): tuple(map(string, value_ids[offsets[index]:offsets[index + 1]]))
+            for index, key_id in enumerate(key_ids)}
+
+
+def interned_tables(strings, sections):
+    """
+    Builds (search_aliases, canonical_name_to_internal_models, internal_model_to_canonical_names)
+    over the output of encode_tables() or the sections of a snapshot.
+    """
+    packed = dict(zip(map(strings.__getitem__, sections['alias_keys']), sections['alias_values']))
+    pool = StringPool(strings, packed)
+    return (
+        AliasTable(pool, packed),
+        RelationTable(pool, sections['name_keys'], sections['name_offsets'], sections['name_models']),
+        RelationTable(pool, sections['model_keys'], sections['model_offsets'], sections['model_names']),
+    )
+
+
+class StringPool:
+    """
+    The strings of the tables by id. Ids below sorted_count are in sorted order.
+    alias_ids is the packed alias dict: canonical names and models are nearly always
+    their own lowercase alias, so their id is usually found there without a search.
+    """
+
+    def __init__(self, strings, alias_ids=None):
+        self.strings = strings
+        self.sorted_count = len(strings)
+        self._alias_ids = alias_ids or {}
+        # Strings added by delta updates, after the sorted ones
+        self._added_ids = {}
+
+    def id_of(self, string):
+        """The id of string, or -1 if it isn't in the pool."""
+        packed = self._alias_ids.get(string.lower())
+        if packed is not None and self.strings[packed >> 1] == string:
+            return packed >> 1
+        index = bisect_left(self.strings, string, 0, self.sorted_count)
+        if index < self.sorted_count and self.strings[index] == string:
+            return index
+        return self._added_ids.get(string, -1)
+
+    def intern(self, string):
+        string_id = self.id_of(string)
+        if string_id < 0:
+            string_id = len(self.strings)
+            self.strings.append(string)
+            self._added_ids[string] = string_id
+        return string_id
+
+
+class AliasTable(MutableMapping):
+    """normalized_query -> (type, original_string_key), stored as alias_key -> packed string id."""
+
+    def __init__(self, pool, packed):
+        self._pool = pool
+        self._packed = packed
+
+    def get(self, key, default=None):
+        value = self._packed.get(key)
+        if value is None:
+            return default
+        return _ALIAS_TYPES[value & ALIAS_IS_MODEL], self._pool.strings[value >> 1]
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        alias_type, original_key = value
+        self._packed[key] = (self._pool.intern(original_key) << 1) | (ALIAS_IS_MODEL if alias_type == "model" else 0)
+
+    def __delitem__(self, key):
+        del self._packed[key]
+
+    def __contains__(self, key):
+        return key in self._packed
+
+    def __iter__(self):
+        return iter(self._packed)
+
+    def __len__(self):
+        return len(self._packed)
+
+    def values(self):
+        strings = self._pool.strings
+        return ((_ALIAS_TYPES[value & ALIAS_IS_MODEL], strings[value >> 1]) for value in self._packed.values())
+
+    def items(self):
+        strings = self._pool.strings
+        return ((key, (_ALIAS_TYPES[value & ALIAS_IS_MODEL], strings[value >> 1]))
+                for key, value in self._packed.items())
+
+
+def derived_tables(strings, sections):
+    """
+    The derived index tables of a snapshot over its decoded strings:
+    {'normalized_keys': NormalizedKeyTable, 'suggestions': the build_suggestion_tables() dict,
+    'model_prefixes': (lowercase codes, codes)}. Lists hold the pooled strings themselves,
+    and the large id arrays are searched in place.
+    """
+    string = strings.__getitem__
+    suggestions = {
+        'strings': list(map(string, sections['suggestion_strings'])),
+        'lowered': list(map(string, sections['suggestion_lowered'])),
+        'weights': sections['suggestion_weights'],
+        'ranks': sections['suggestion_ranks'],
+        'token_keys': list(map(string, sections['suggestion_token_keys'])),
+        'token_ids': sections['suggestion_token_ids'],
+    }
+    for name, prefix in SUGGESTION_ID_LISTS:
+        suggestions[name] = IdLists(strings, sections[prefix + '_keys'], sections[prefix + '_offsets'],
+                                    sections[prefix + '_ids'])
+    return {
+        'normalized_keys': NormalizedKeyTable(strings, sections['normalized_keys'], sections['normalized_aliases']),
+        'suggestions': suggestions,
+        'model_prefixes': (list(map(string, sections['model_prefix_keys'])),
+                           list(map(string, sections['model_prefix_codes']))),
+    }
+
+
+class _SortedIdKeys:
+    """
+    Base for a read-only table keyed by the sorted string ids of its keys. Only the strings
+    present at construction are searched, so strings appended by delta updates don't disturb it.
+    """
+
+    def __init__(self, strings, key_ids):
+        self._strings = strings
+        self._sorted_count = len(strings)
+        self._key_ids = key_ids
+
+    def _position(self, key):
+        """The index of key among the keys, or -1."""
+        strings = self._strings
+        string_id = bisect_left(strings, key, 0, self._sorted_count)
+        if string_id == self._sorted_count or strings[string_id] != key:
+            return -1
+        index = bisect_left(self._key_ids, string_id)
+        if index == len(self._key_ids) or self._key_ids[index] != string_id:
+            return -1
+        return index
+
+    def __len__(self):
+        return len(self._key_ids)
+
+
+class NormalizedKeyTable(_SortedIdKeys):
+    """normalized_key -> (alias_key, relaxed), stored as the packed alias id of every normalized key."""
+
+    def __init__(self, strings, key_ids, packed_aliases):
+        super().__init__(strings, key_ids)
+        self._packed_aliases = packed_aliases
+
+    def get(self, key, default=None):
+        index = self._position(key)
+        if index < 0:
+            return default
+        value = self._packed_aliases[index]
+        return self._strings[value >> 1], bool(value & NORMALIZED_IS_RELAXED)
+
+
+class IdLists(_SortedIdKeys):
+    """key -> array of ints, stored as CSR arrays: the suggestion postings and top-k lists."""
+
+    def __init__(self, strings, key_ids, offsets, values):
+        super().__init__(strings, key_ids)
+        self._offsets = offsets
+        self._values = values
+
+    def get(self, key, default=None):
+        index = self._position(key)
+        if index < 0:
+            return default
+        return self._values[self._offsets[index]:self._offsets[index + 1]]
+
+
+class RelationTable(MutableMapping):
+    """key -> tuple of related strings, stored as CSR arrays of string ids plus a change overlay."""
+
+    def __init__(self, pool, key_ids, offsets, value_ids):
+        self._pool = pool
+        self._key_ids = key_ids
+        self._offsets = offsets
+        self._value_ids = value_ids
+        # The position of every pooled string among the keys (_NOT_A_KEY if it isn't one), so a
+        # lookup needs no search; it costs 4 bytes per pooled string.
+        self._positions = array('I', b'\xff' * (4 * pool.sorted_count))
+        for index, key_id in enumerate(key_ids):
+            self._positions[key_id] = index
+        # key -> tuple, or None once deleted; entries here override the arrays
+        self._changed = {}
+        self._len = len(key_ids)
+
+    def get(self, key, default=None):
+        if self._changed and key in self._changed:
+            value = self._changed[key]
+            return default if value is None else value
+        key_id = self._pool.id_of(key)
+        if key_id < 0 or key_id >= len(self._positions) or self._positions[key_id] == _NOT_A_KEY:
+            return default
+        index = self._positions[key_id]
+        start, end = self._offsets[index], self._offsets[index + 1]
+        strings = self._pool.strings
+        if end - start == 1:
+            # Most keys have one value; this skips the slice.
+            return (strings[self._value_ids[start]],)
+        return tuple(map(strings.__getitem__, self._value_ids[start:end]))
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._len += 1
+        self._changed[key] = tuple(value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._changed[key] = None
+        self._len -= 1
+
+    def __iter__(self):
+        strings = self._pool.strings
+        for key_id in self._key_ids:
+            if strings[key_id] not in self._changed:
+                yield strings[key_id]
+        for key, value in list(self._changed.items()):
+            if value is not None:
+                yield key
+
+    def __len__(self):
+        return self._len
+
+    def items(self):
+        return ((key, self[key]) for key in self)
+
+    def values(self):
+        return (self[key] for key in self)
+
+
+def _traced_size(build):
+    """Bytes allocated by build() and still alive once it returns, with the result."""
+    import gc
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    import os
+    from lookup_tables import parse_sources
+
+    data_dir = os.path.dirname(os.path.abspath(__file__))
+    plain_bytes, plain = _traced_size(lambda: parse_sources(data_dir))
+    # Built from a separate parse whose dicts are gone by the time it is measured, so the
+    # interned tables own all of their strings.
+    interned_bytes, _ = _traced_size(lambda: interned_tables(*encode_tables(*parse_sources(data_dir))))
+    print(f"aliases: {len(plain[0])}, names: {len(plain[1])}, models: {len(plain[2])}")
+    print(f"   dicts of tuples and sets: {plain_bytes / 1e6:.1f} MB")
+    print(f"interned strings and arrays: {interned_bytes / 1e6:.1f} MB "
+          f"({100 * (1 - interned_bytes / plain_bytes):.0f}% less)")
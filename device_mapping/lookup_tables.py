@@ -0,0 +1,591 @@
+"""
+Parses the device data files and compiles them into a binary snapshot.
+
+Run `python lookup_tables.py` after editing any of the .txt data files to
+rebuild the snapshot. Processes that find a snapshot matching the current
+data files load it instead of parsing the text sources again.
+"""
+import io
+import re
+import sys
+import json
+import csv
+import os
+import hashlib
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from deltas import apply_delta_ops, delta_records, folded_delta_offsets, pending_delta_ops
+from validation import DataError, ValidationReport
+from interned_tables import derived_tables, encode_tables, interned_tables, relation_dict
+from normalizer import build_normalized_keys
+from suggest_index import build_suggestion_tables, suggestion_weights
+
+SOURCE_FILES = ('mapping_devices.txt', 'device_names.txt', 'mapping_ios_devices.txt')
+SNAPSHOT_FILE = 'lookup_tables.snapshot'
+SNAPSHOT_MAGIC = b'DMAPSNAP'
+SNAPSHOT_VERSION = 5
+
+# Sections are arrays of unsigned 32-bit ints, except the string blob.
+_SECTIONS = (
+    'string_offsets', 'string_blob',
+    'alias_keys', 'alias_values', 'alias_weights',
+    'name_keys', 'name_offsets', 'name_models',
+    'model_keys', 'model_offsets', 'model_names',
+    'maker_keys', 'maker_offsets', 'maker_names',
+    'normalized_keys', 'normalized_aliases',
+    'model_prefix_keys', 'model_prefix_codes',
+    'suggestion_strings', 'suggestion_lowered', 'suggestion_weights', 'suggestion_ranks',
+    'suggestion_token_keys', 'suggestion_token_ids',
+    'suggestion_gram_keys', 'suggestion_gram_offsets', 'suggestion_gram_ids',
+    'suggestion_top_prefix_keys', 'suggestion_top_prefix_offsets', 'suggestion_top_prefix_ids',
+    'suggestion_top_token_keys', 'suggestion_top_token_offsets', 'suggestion_top_token_ids',
+)
+DEVICE_NAMES_HEADER = ['device_make', 'device_model', '_col2']
+# mapping_ios_devices.txt has no manufacturer column
+IOS_MANUFACTURER = 'Apple'
+# Characters read at a time while streaming mapping_devices.txt
+JSON_CHUNK_SIZE = 64 * 1024
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def parse_sources(base_path, alias_weights=None, report=None, manufacturers=None):
+    """
+    Parses the three text data files found in base_path.
+    Returns (search_aliases, canonical_name_to_internal_models, internal_model_to_canonical_names).
+    If alias_weights is a dict it is filled with {alias_key: device count} from device_names.txt,
+    and if manufacturers is a dict it is filled with {manufacturer: set(canonical names)}.
+    If report is a ValidationReport every conflict, duplicate and malformed row is recorded in it
+    and malformed rows are skipped; without one a malformed mapping_devices.txt entry raises DataError.
+    Missing files raise FileNotFoundError and malformed JSON raises json.JSONDecodeError.
+    """
+    if alias_weights is None:
+        alias_weights = {}
+    if manufacturers is None:
+        manufacturers = {}
+    canonical_name_to_internal_models = defaultdict(set)
+    internal_model_to_canonical_names = defaultdict(set)
+    search_aliases = {}  # Maps normalized_query -> (type, original_string_key)
+    # Where each alias and model was last set, kept only for the report
+    alias_locations = {}
+    model_locations = {}
+
+    def set_alias(alias_key, value, location, replaces_model=False):
+        """Applies the precedence rules: a name alias replaces a model alias only if replaces_model is set."""
+        current = search_aliases.get(alias_key)
+        if current is not None and current[0] == "model" and value[0] == "name" and not replaces_model:
+            if report is not None:
+                report.conflict('name_alias_dropped', location,
+                                f"'{alias_key}' -> '{value[1]}' ignored: the alias is model '{current[1]}' "
+                                f"({alias_locations[alias_key]})", alias=alias_key, name=value[1], model=current[1])
+            return
+        if report is not None:
+            if current is not None and current != value:
+                kind = {("name", "name"): 'name_alias_reassigned', ("name", "model"): 'model_replaces_name_alias',
+                        ("model", "name"): 'name_replaces_model_alias',
+                        ("model", "model"): 'model_alias_reassigned'}[current[0], value[0]]
+                report.conflict(kind, location, f"'{alias_key}' -> {value[0]} '{value[1]}' replaces {current[0]} "
+                                                f"'{current[1]}' ({alias_locations[alias_key]})",
+                                alias=alias_key, previous=list(current), value=list(value))
+            alias_locations[alias_key] = location
+        search_aliases[alias_key] = value
+
+    def add_model(model_code, canonical_name, location):
+        canonical_name_to_internal_models[canonical_name].add(model_code)
+        internal_model_to_canonical_names[model_code].add(canonical_name)
+        if report is not None:
+            model_locations.setdefault(model_code, location)
+
+    mapping_devices_path = os.path.join(base_path, 'mapping_devices.txt')
+    device_names_path = os.path.join(base_path, 'device_names.txt')
+    ios_device_mapping_path = os.path.join(base_path, 'mapping_ios_devices.txt')
+
+    # The two smaller files are read on other threads while step 1 streams the big one. Their rows
+    # are still parsed and applied after step 1, in file order, so the precedence rules see the
+    # same sequence of rows.
+    executor = ThreadPoolExecutor(max_workers=2)
+    device_names_text = executor.submit(_read_text, device_names_path)
+    ios_devices_text = executor.submit(_read_text, ios_device_mapping_path)
+    executor.shutdown(wait=False)
+
+    # Step 1: Process mapping_devices.txt (Android canonical names and models), one entry at a time
+    canonical_locations = {}
+    for location, entry in _mapping_entries(mapping_devices_path, report):
+        manufacturer = entry[0].strip()
+        canonical_device_name = entry[1].strip()
+        if report is not None:
+            if not canonical_device_name:
+                report.warning('empty_device_name', location, "the device name (field 1) is empty", entry=entry)
+            if canonical_device_name in canonical_locations:
+                report.duplicate('repeated_canonical_name', location,
+                                 f"'{canonical_device_name}' also defined at "
+                                 f"{canonical_locations[canonical_device_name]}; the entries are merged",
+                                 name=canonical_device_name)
+            canonical_locations.setdefault(canonical_device_name, location)
+        set_alias(canonical_device_name.lower(), ("name", canonical_device_name), location, replaces_model=True)
+        combined_name_by_manufacturer = f"{manufacturer} {canonical_device_name}".strip()
+        if combined_name_by_manufacturer.lower() != canonical_device_name.lower():
+            set_alias(combined_name_by_manufacturer.lower(), ("name", canonical_device_name), location,
+                      replaces_model=True)
+        if len(entry) > 2 and entry[2]:
+            alias_from_entry2 = entry[2].strip()
+            if alias_from_entry2 and alias_from_entry2.lower() != canonical_device_name.lower() and \
+                    alias_from_entry2.lower() != combined_name_by_manufacturer.lower():
+                set_alias(alias_from_entry2.lower(), ("name", canonical_device_name), location)
+        if manufacturer and canonical_device_name:
+            manufacturers.setdefault(manufacturer, set()).add(canonical_device_name)
+        specific_internal_models = [m.strip() for m in entry[3:] if m.strip()] if len(entry) > 3 else []
+        canonical_name_to_internal_models[canonical_device_name].update(specific_internal_models)
+        # Internal models take priority over names on conflict.
+        for model_code in specific_internal_models:
+            add_model(model_code, canonical_device_name, location)
+            set_alias(model_code.lower(), ("model", model_code), location)
+
+    # Step 2: Process device_names.txt (extra name aliases; never overrides a model)
+    with io.StringIO(device_names_text.result()) as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader, None)  # Skip the header row
+        if report is not None and header != DEVICE_NAMES_HEADER:
+            report.warning('unexpected_header', "device_names.txt:1",
+                           f"expected {DEVICE_NAMES_HEADER}, got {header}; the first row was skipped")
+        seen_rows = {}
+        for row in reader:
+            location = f"device_names.txt:{reader.line_num}"
+            if len(row) < 2:
+                if report is not None and row:
+                    report.warning('short_row', location, f"expected at least 2 columns, got {len(row)}; "
+                                                          f"the row was skipped", row=row)
+                continue
+            make_from_file = row[0].strip()
+            device_name_from_file = row[1].strip()
+            # The third column counts devices; it ranks the suggestions.
+            count = row[2].strip() if len(row) > 2 else ''
+            if report is not None:
+                if not device_name_from_file:
+                    report.warning('empty_device_name', location, "the device_model column is empty", row=row)
+                if count and not count.isdigit():
+                    report.warning('invalid_count', location, f"device count '{count}' is not a number; "
+                                                              f"it was ignored", row=row)
+                row_key = (make_from_file, device_name_from_file)
+                if row_key in seen_rows:
+                    report.duplicate('repeated_device_row', location,
+                                     f"'{make_from_file}\t{device_name_from_file}' repeats "
+                                     f"{seen_rows[row_key]}; the device counts are added up", row=row)
+                seen_rows.setdefault(row_key, location)
+            set_alias(device_name_from_file.lower(), ("name", device_name_from_file), location)
+            combined_alias = f"{make_from_file} {device_name_from_file}".strip()
+            set_alias(combined_alias.lower(), ("name", combined_alias), location)
+            if count.isdigit():
+                for alias_key in {device_name_from_file.lower(), combined_alias.lower()}:
+                    alias_weights[alias_key] = alias_weights.get(alias_key, 0) + int(count)
+
+    # Step 3: Process mapping_ios_devices.txt (iOS models and names)
+    with io.StringIO(ios_devices_text.result()) as f:
+        seen_rows = {}
+        for line_number, line in enumerate(f, 1):
+            location = f"mapping_ios_devices.txt:{line_number}"
+            line = line.strip()
+            if not line or line.startswith('device_model'):
+                continue
+            parts = line.split(':', 1)
+            if len(parts) < 2 or not parts[0].strip() or not parts[1].strip():
+                if report is not None:
+                    report.warning('malformed_line', location, "expected 'model : name'; the line was skipped",
+                                   line=line)
+                continue
+            ios_model, ios_name = parts[0].strip(), parts[1].strip()
+            if report is not None:
+                if (ios_model, ios_name) in seen_rows:
+                    report.duplicate('repeated_ios_row', location,
+                                     f"'{ios_model} : {ios_name}' repeats {seen_rows[ios_model, ios_name]}",
+                                     model=ios_model, name=ios_name)
+                seen_rows.setdefault((ios_model, ios_name), location)
+            add_model(ios_model, ios_name, location)
+            manufacturers.setdefault(IOS_MANUFACTURER, set()).add(ios_name)
+            set_alias(ios_name.lower(), ("name", ios_name), location)
+            set_alias(ios_model.lower(), ("model", ios_model), location)
+
+    if report is not None:
+        for model_code, names in sorted(internal_model_to_canonical_names.items()):
+            if len(names) > 1:
+                report.conflict('model_multiple_names', model_locations[model_code],
+                                f"model '{model_code}' maps to {len(names)} names: {', '.join(sorted(names))}",
+                                model=model_code, names=sorted(names))
+
+    return search_aliases, canonical_name_to_internal_models, internal_model_to_canonical_names
+
+
+def _read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _mapping_entries(path, report):
+    """
+    Yields (location, entry) for every well-formed entry of mapping_devices.txt, streaming the file.
+    Malformed entries and invalid JSON are recorded in report, or raised without one.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            for index, entry in enumerate(iter_json_array(f)):
+                location = f"mapping_devices.txt[{index}]"
+                problem = _entry_problem(entry)
+                if problem is not None:
+                    if report is None:
+                        raise DataError(f"{location}: {problem}")
+                    report.error('malformed_entry', location, problem, entry=entry)
+                    continue
+                yield location, entry
+        except json.JSONDecodeError as e:
+            if report is None:
+                raise
+            # The entries before the error are kept; the error alone fails the compile step.
+            report.error('invalid_json', f"mapping_devices.txt:{e.lineno}:{e.colno}", e.msg)
+
+
+def iter_json_array(f, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Yields the elements of the JSON array in the text file f one at a time, reading chunk_size
+    characters at a time, so the whole array is never held in memory. Raises json.JSONDecodeError,
+    with the line and column in the file, if the text isn't a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    # Characters, lines and trailing columns already dropped from the buffer, for error positions
+    dropped_chars, dropped_lines, dropped_columns = 0, 0, 0
+
+    def error(message, at):
+        e = json.JSONDecodeError(message, buffer, at)
+        if e.lineno == 1:
+            e.colno += dropped_columns
+        e.lineno += dropped_lines
+        e.pos += dropped_chars
+        e.args = (f"{message}: line {e.lineno} column {e.colno} (char {e.pos})",)
+        return e
+
+    def fill():
+        """Reads more text, dropping what was consumed. Returns False at the end of the file."""
+        nonlocal buffer, position, eof, dropped_chars, dropped_lines, dropped_columns
+        chunk = '' if eof else f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        consumed = buffer[:position]
+        dropped_chars += position
+        newlines = consumed.count('\n')
+        dropped_lines += newlines
+        dropped_columns = len(consumed) - consumed.rfind('\n') - 1 if newlines else dropped_columns + len(consumed)
+        buffer, position = buffer[position:] + chunk, 0
+        return True
+
+    def next_char():
+        """Skips whitespace and returns the next character, or '' at the end of the file."""
+        nonlocal position
+        while True:
+            position = _JSON_WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) or not fill():
+                return buffer[position] if position < len(buffer) else ''
+
+    first = next_char()
+    if first != '[':
+        raise error("Expecting '['" if first else "Expecting value", position)
+    position += 1
+    if next_char() == ']':
+        position += 1
+        if next_char():
+            raise error("Extra data", position)
+        return
+    while True:
+        # raw_decode() doesn't skip leading whitespace
+        next_char()
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            # The element may only be cut off by the end of the buffer.
+            if fill():
+                continue
+            raise error(e.msg, e.pos)
+        # Only a delimiter proves the element complete: a number cut off by the end of the
+        # buffer ("-1" of "-1.5e3") still decodes.
+        if (end == len(buffer) or buffer[end] not in ' \t\r\n,]') and fill():
+            continue
+        position = end
+        yield element
+        separator = next_char()
+        if separator == ']':
+            position += 1
+            if next_char():
+                raise error("Extra data", position)
+            return
+        if separator != ',':
+            raise error("Expecting ',' delimiter", position)
+        position += 1
+
+
+
+def _entry_problem(entry):
+    """Why a mapping_devices.txt entry can't be used, or None."""
+    if not isinstance(entry, list):
+        return f"expected a list, got {type(entry).__name__}"
+    if len(entry) < 2:
+        return f"expected at least [manufacturer, name], got {len(entry)} fields"
+    for position, value in enumerate(entry):
+        if not isinstance(value, str) and not (position == 2 and value is None):
+            return f"field {position} is {type(value).__name__}, expected a string"
+    return None
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprints(base_path):
+    """Returns size, mtime and content hash of every source file."""
+    fingerprints = {}
+    for filename in SOURCE_FILES:
+        path = os.path.join(base_path, filename)
+        stat = os.stat(path)
+        fingerprints[filename] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': _file_sha256(path),
+        }
+    return fingerprints
+
+
+def sources_match(base_path, fingerprints):
+    """Checks recorded fingerprints against the files; mtime first, hash only if mtime differs."""
+    if set(fingerprints) != set(SOURCE_FILES):
+        return False
+    for filename, recorded in fingerprints.items():
+        path = os.path.join(base_path, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != recorded['size']:
+            return False
+        if stat.st_mtime_ns != recorded['mtime_ns'] and _file_sha256(path) != recorded['sha256']:
+            return False
+    return True
+
+
+def write_snapshot(path, search_aliases, canonical_name_to_internal_models,
+                   internal_model_to_canonical_names, fingerprints, folded_deltas=None, alias_weights=None,
+                   manufacturers=None, normalized_keys=None):
+    """
+    Writes the tables as one versioned snapshot file (atomically replaced).
+    folded_deltas records which delta files (and how much of each) are already included,
+    and normalized_keys is the output of build_normalized_keys() for search_aliases.
+    The suggestion index is computed here and stored along with the tables.
+    """
+    suggestions = build_suggestion_tables(*suggestion_weights(search_aliases, alias_weights or {}))
+    strings, sections = encode_tables(search_aliases, canonical_name_to_internal_models,
+                                      internal_model_to_canonical_names, alias_weights, manufacturers,
+                                      normalized_keys, suggestions)
+    encoded = [s.encode('utf-8') for s in strings]
+    string_offsets = array('I', [0])
+    for raw in encoded:
+        string_offsets.append(string_offsets[-1] + len(raw) + 1)
+    sections['string_offsets'] = string_offsets
+    # Every string is followed by a NUL so the whole table decodes with one split().
+    sections['string_blob'] = b''.join(raw + b'\0' for raw in encoded)
+
+    payloads = [bytes(sections[name]) for name in _SECTIONS]
+    header = {
+        'byteorder': sys.byteorder,
+        'sources': fingerprints,
+        'deltas': folded_deltas or {},
+        'counts': {'strings': len(strings), 'aliases': len(search_aliases)},
+        'sections': {},
+    }
+    # The header holds the section offsets, so grow it until its own length is stable.
+    header_len = 0
+    while True:
+        offset = _align(len(SNAPSHOT_MAGIC) + 8 + header_len)
+        for name, payload in zip(_SECTIONS, payloads):
+            header['sections'][name] = [offset, len(payload)]
+            offset = _align(offset + len(payload))
+        header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+        if len(header_bytes) <= header_len:
+            header_bytes = header_bytes.ljust(header_len)
+            break
+        header_len = len(header_bytes)
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(array('I', [SNAPSHOT_VERSION, len(header_bytes)]).tobytes())
+        f.write(header_bytes)
+        for name, payload in zip(_SECTIONS, payloads):
+            f.write(b'\0' * (header['sections'][name][0] - f.tell()))
+            f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def _align(offset):
+    return (offset + 3) & ~3
+
+
+def read_snapshot_header(buffer):
+    """Returns the snapshot header dict, or None if the buffer isn't a compatible snapshot."""
+    if array('I').itemsize != 4 or buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        return None
+    version, header_len = array('I', bytes(buffer[len(SNAPSHOT_MAGIC):len(SNAPSHOT_MAGIC) + 8]))
+    if version != SNAPSHOT_VERSION:
+        return None
+    start = len(SNAPSHOT_MAGIC) + 8
+    header = json.loads(bytes(buffer[start:start + header_len]))
+    if header['byteorder'] != sys.byteorder:
+        return None
+    return header
+
+
+def _section(buffer, header, name):
+    offset, length = header['sections'][name]
+    if name == 'string_blob':
+        return buffer[offset:offset + length]
+    values = array('I')
+    values.frombytes(buffer[offset:offset + length])
+    return values
+
+
+def read_snapshot(path, base_path):
+    """
+    Loads the tables from a snapshot file and returns
+    (tables, alias_weights, manufacturers, derived, header); derived holds the
+    tables of the derived indexes (interned_tables.derived_tables()).
+    Returns None when the snapshot is missing, from another format version or
+    stale with respect to the source files in base_path.
+    """
+    try:
+        with open(path, 'rb') as f:
+            buffer = f.read()
+    except OSError:
+        return None
+    header = read_snapshot_header(buffer)
+    if header is None or not sources_match(base_path, header['sources']):
+        return None
+
+    # The blob ends with a NUL, so split() leaves one empty string after the last one.
+    strings = bytes(_section(buffer, header, 'string_blob')).decode('utf-8').split('\0')[:-1]
+    sections = {name: _section(buffer, header, name) for name in _SECTIONS
+                if name not in ('string_offsets', 'string_blob')}
+    weights = zip(sections['alias_keys'], sections['alias_weights'])
+    alias_weights = {strings[key_id]: weight for key_id, weight in weights if weight}
+    manufacturers = relation_dict(strings.__getitem__, sections['maker_keys'], sections['maker_offsets'],
+                                  sections['maker_names'])
+    # Built before interned_tables(), whose pool appends the strings added by delta updates.
+    derived = derived_tables(strings, sections)
+    return interned_tables(strings, sections), alias_weights, manufacturers, derived, header
+
+
+def load_tables(base_path, delta_offsets=None, alias_weights=None, manufacturers=None, indexes=None):
+    """
+    Loads the tables from a fresh snapshot if there is one, otherwise from the text sources,
+    then applies the delta files not already folded in. The tables are interned
+    (interned_tables.py) and behave like the dicts returned by parse_sources().
+    If delta_offsets is a dict it is filled with {delta_filename: applied_byte_offset},
+    if alias_weights is a dict it is filled with {alias_key: device count}, and if
+    manufacturers is a dict it is filled with {manufacturer: canonical names}.
+    Delta files don't carry manufacturers, so names they add aren't listed under one.
+    If indexes is a dict it is filled with the derived index tables compiled into the snapshot
+    (none if the text sources were parsed), and the delta files are left to the caller, who
+    has to update those indexes along with the tables: delta_offsets then only holds what
+    the snapshot already includes.
+    """
+    snapshot = read_snapshot(os.path.join(base_path, SNAPSHOT_FILE), base_path)
+    offsets = None
+    if snapshot is not None:
+        tables, weights, makers, derived, header = snapshot
+        offsets = folded_delta_offsets(base_path, header.get('deltas', {}))
+    if offsets is None:
+        print(f"{SNAPSHOT_FILE} is missing or stale; parsing the text sources "
+              f"(run 'python lookup_tables.py' to validate and compile them).", file=sys.stderr)
+        weights, makers, derived = {}, {}, {}
+        parsed = parse_sources(base_path, weights, manufacturers=makers)
+        tables, offsets = interned_tables(*encode_tables(*parsed)), {}
+    if indexes is None:
+        ops, offsets = pending_delta_ops(base_path, offsets)
+        apply_delta_ops(*tables, ops)
+    else:
+        indexes.update(derived)
+    if delta_offsets is not None:
+        delta_offsets.update(offsets)
+    if alias_weights is not None:
+        alias_weights.update(weights)
+    if manufacturers is not None:
+        manufacturers.update(makers)
+    return tables
+
+
+def build_snapshot(base_path, report=None):
+    """
+    Validates and parses the text sources in base_path, folds in every delta file and writes
+    a fresh snapshot. Raises DataError, without touching the current snapshot, if any row
+    can't be parsed; the full diagnostics are left in report (a ValidationReport) if given.
+    """
+    if report is None:
+        report = ValidationReport()
+    fingerprints = source_fingerprints(base_path)
+    alias_weights, manufacturers = {}, {}
+    tables = parse_sources(base_path, alias_weights, report, manufacturers)
+    if not report.ok:
+        first = report.errors[0]
+        raise DataError(f"{len(report.errors)} rows can't be parsed, "
+                        f"the first at {first['location']}: {first['message']}")
+    ops, offsets = pending_delta_ops(base_path, {})
+    apply_delta_ops(*tables, ops)
+    normalized_keys, collisions = build_normalized_keys(tables[0])
+    report_collisions(report, collisions)
+    snapshot_path = os.path.join(base_path, SNAPSHOT_FILE)
+    write_snapshot(snapshot_path, *tables, fingerprints, delta_records(base_path, offsets), alias_weights,
+                   manufacturers, normalized_keys)
+    return snapshot_path
+
+
+def report_collisions(report, collisions):
+    """Records the normalized-key collisions of build_normalized_keys() as conflicts in report."""
+    for collision in collisions:
+        location = f"normalized key '{collision['normalized']}'"
+        if collision['kept'] is None:
+            report.conflict('relaxed_key_ambiguous', location,
+                            f"{', '.join(collision['dropped'])} only differ in release tags; "
+                            f"none of them is suggested for it", **collision)
+        else:
+            report.conflict('normalized_key_collision', location,
+                            f"'{collision['kept']}' kept; {', '.join(collision['dropped'])} "
+                            f"only match when typed exactly", **collision)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validates the data files and compiles them into the snapshot.")
+    parser.add_argument('data_dir', nargs='?', default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--check', action='store_true', help="validate only, don't write the snapshot")
+    parser.add_argument('--report', help="write the full validation report to this JSON file")
+    args = parser.parse_args()
+
+    validation_report = ValidationReport()
+    try:
+        if args.check:
+            parsed = parse_sources(args.data_dir, report=validation_report)
+            report_collisions(validation_report, build_normalized_keys(parsed[0])[1])
+        else:
+            print(f"Snapshot written to {build_snapshot(args.data_dir, validation_report)}")
+    except DataError as e:
+        print(f"Snapshot not written: {e}")
+    finally:
+        print(validation_report.summary())
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(validation_report.to_dict(), f, indent=1, ensure_ascii=False)
+            print(f"Full report written to {args.report}")
+    if not validation_report.ok:
+        sys.exit(1)
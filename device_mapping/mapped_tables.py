@@ -0,0 +1,250 @@
+"""
+Read-only, mmap-backed view of the lookup tables stored in the snapshot file.
+
+All gunicorn workers map the same file, so the tables live once in the OS
+page cache instead of once per worker heap. That includes the derived
+indexes: the normalized keys, the suggestion index and the model-prefix
+order are compiled into the snapshot and searched in the mapped arrays, so
+a worker builds no per-process copy of them. Only the manufacturer lists are
+decoded up front. The views expose the same `.get()` interface as the
+interned tables, so DeviceIndex works unchanged on top of them.
+
+Run `python mapped_tables.py` to compare worker RSS for both backends.
+"""
+import os
+import sys
+import mmap
+import json
+import subprocess
+from collections.abc import Mapping, Sequence
+
+from lookup_tables import SNAPSHOT_FILE, read_snapshot_header, sources_match
+from interned_tables import ALIAS_IS_MODEL, NORMALIZED_IS_RELAXED, SUGGESTION_ID_LISTS, relation_dict
+from deltas import folded_delta_offsets, pending_delta_ops
+
+
+class _SortedKeyView(Mapping):
+    """Base for a mapping whose keys are string ids sorted by their UTF-8 bytes."""
+
+    def __init__(self, tables, key_ids):
+        self._tables = tables
+        self._key_ids = key_ids
+
+    def _find(self, key):
+        if not isinstance(key, str):
+            return -1
+        raw = key.encode('utf-8')
+        raw_string = self._tables.raw_string
+        key_ids = self._key_ids
+        lo, hi = 0, len(key_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if raw_string(key_ids[mid]) < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(key_ids) and raw_string(key_ids[lo]) == raw:
+            return lo
+        return -1
+
+    def _value_at(self, index):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        index = self._find(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._value_at(index)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __len__(self):
+        return len(self._key_ids)
+
+    def __iter__(self):
+        string = self._tables.string
+        return (string(key_id) for key_id in self._key_ids)
+
+    def values(self):
+        return (self._value_at(index) for index in range(len(self._key_ids)))
+
+    def items(self):
+        string = self._tables.string
+        return ((string(key_id), self._value_at(index)) for index, key_id in enumerate(self._key_ids))
+
+
+class _AliasView(_SortedKeyView):
+    """normalized_query -> (type, original_string_key), like search_aliases."""
+
+    def __init__(self, tables, key_ids, packed_values):
+        super().__init__(tables, key_ids)
+        self._packed_values = packed_values
+
+    def _value_at(self, index):
+        value = self._packed_values[index]
+        return ("model" if value & ALIAS_IS_MODEL else "name", self._tables.string(value >> 1))
+
+
+class _NormalizedKeyView(_SortedKeyView):
+    """normalized_key -> (alias_key, relaxed), the table behind NormalizedKeyIndex."""
+
+    def __init__(self, tables, key_ids, packed_aliases):
+        super().__init__(tables, key_ids)
+        self._packed_aliases = packed_aliases
+
+    def _value_at(self, index):
+        value = self._packed_aliases[index]
+        return self._tables.string(value >> 1), bool(value & NORMALIZED_IS_RELAXED)
+
+
+class _IdListView(_SortedKeyView):
+    """key -> ints, stored as CSR offset/value arrays: the suggestion postings and top-k lists."""
+
+    def __init__(self, tables, key_ids, offsets, values):
+        super().__init__(tables, key_ids)
+        self._offsets = offsets
+        self._values = values
+
+    def _value_at(self, index):
+        return self._values[self._offsets[index]:self._offsets[index + 1]]
+
+
+class _StringList(Sequence):
+    """A list of strings stored as an array of string ids, decoded on access."""
+
+    def __init__(self, tables, string_ids):
+        self._tables = tables
+        self._string_ids = string_ids
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._tables.string(string_id) for string_id in self._string_ids[index]]
+        return self._tables.string(self._string_ids[index])
+
+    def __len__(self):
+        return len(self._string_ids)
+
+
+class _RelationView(_SortedKeyView):
+    """key -> tuple of related strings, stored as CSR offset/value arrays."""
+
+    def __init__(self, tables, key_ids, offsets, value_ids):
+        super().__init__(tables, key_ids)
+        self._offsets = offsets
+        self._value_ids = value_ids
+
+    def _value_at(self, index):
+        string = self._tables.string
+        return tuple(string(value_id) for value_id in self._value_ids[self._offsets[index]:self._offsets[index + 1]])
+
+
+class MappedTables:
+    """Maps a snapshot file and exposes its three tables as read-only mappings."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = read_snapshot_header(self._mmap)
+        if self.header is None:
+            self._mmap.close()
+            raise ValueError(f"'{path}' is not a compatible lookup snapshot.")
+        buffer = memoryview(self._mmap)
+        sections = {}
+        for name, (offset, length) in self.header['sections'].items():
+            section = buffer[offset:offset + length]
+            sections[name] = section if name == 'string_blob' else section.cast('I')
+        self._blob = sections['string_blob']
+        self._string_offsets = sections['string_offsets']
+
+        self.search_aliases = _AliasView(self, sections['alias_keys'], sections['alias_values'])
+        self.canonical_name_to_internal_models = _RelationView(
+            self, sections['name_keys'], sections['name_offsets'], sections['name_models'])
+        self.internal_model_to_canonical_names = _RelationView(
+            self, sections['model_keys'], sections['model_offsets'], sections['model_names'])
+        # The derived index tables compiled into the snapshot, laid out like
+        # interned_tables.derived_tables() but searched in the mapped arrays
+        suggestions = {
+            'strings': _StringList(self, sections['suggestion_strings']),
+            'lowered': _StringList(self, sections['suggestion_lowered']),
+            'weights': sections['suggestion_weights'],
+            'ranks': sections['suggestion_ranks'],
+            'token_keys': _StringList(self, sections['suggestion_token_keys']),
+            'token_ids': sections['suggestion_token_ids'],
+        }
+        for name, prefix in SUGGESTION_ID_LISTS:
+            suggestions[name] = _IdListView(self, sections[prefix + '_keys'], sections[prefix + '_offsets'],
+                                            sections[prefix + '_ids'])
+        self.indexes = {
+            'normalized_keys': _NormalizedKeyView(self, sections['normalized_keys'], sections['normalized_aliases']),
+            'suggestions': suggestions,
+            'model_prefixes': (_StringList(self, sections['model_prefix_keys']),
+                               _StringList(self, sections['model_prefix_codes'])),
+        }
+        # A few dozen manufacturers, small enough to decode up front
+        self.manufacturers = relation_dict(self.string, sections['maker_keys'], sections['maker_offsets'],
+                                           sections['maker_names'])
+
+    def raw_string(self, string_id):
+        # Each string is stored with a trailing NUL that isn't part of it.
+        return self._blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1] - 1].tobytes()
+
+    def string(self, string_id):
+        return self.raw_string(string_id).decode('utf-8')
+
+
+def open_mapped_tables(base_path):
+    """
+    Returns MappedTables for the snapshot in base_path, or None if it is missing, stale
+    or there are delta changes it doesn't include (the mapped tables are read-only).
+    """
+    path = os.path.join(base_path, SNAPSHOT_FILE)
+    try:
+        tables = MappedTables(path)
+    except (OSError, ValueError):
+        return None
+    if not sources_match(base_path, tables.header['sources']):
+        return None
+    tables.delta_offsets = folded_delta_offsets(base_path, tables.header.get('deltas', {}))
+    if tables.delta_offsets is None or pending_delta_ops(base_path, tables.delta_offsets)[0]:
+        return None
+    return tables
+
+
+_RSS_PROBE = """
+import json, os, sys
+os.environ['DEVICE_MAPPING_STORE'] = sys.argv[1]
+import app
+for query in ('iPhone 15 Pro', 'SM-S908U', 'Pixel 7', 'galaxy s23 ultra'):
+    app._perform_single_lookup_logic(query, 'model')
+    app._perform_single_lookup_logic(query, 'name')
+status = {}
+with open('/proc/self/status') as f:
+    for line in f:
+        key, _, value = line.partition(':')
+        if key in ('VmRSS', 'RssAnon', 'RssFile'):
+            status[key] = int(value.split()[0])
+print(json.dumps(status))
+"""
+
+
+def measure_worker_rss(base_path):
+    """Imports app.py in a fresh process per backend and returns its RSS breakdown in kB (Linux only)."""
+    results = {}
+    for store in ('dict', 'mmap'):
+        output = subprocess.run(
+            [sys.executable, '-c', _RSS_PROBE, store],
+            cwd=base_path, capture_output=True, text=True, check=True,
+        ).stdout
+        results[store] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+if __name__ == '__main__':
+    data_dir = os.path.dirname(os.path.abspath(__file__))
+    if open_mapped_tables(data_dir) is None:
+        print("No fresh snapshot found. Run 'python lookup_tables.py' first.")
+        sys.exit(1)
+    for store, status in measure_worker_rss(data_dir).items():
+        print(f"{store:>5}: VmRSS {status['VmRSS']} kB (private RssAnon {status['RssAnon']} kB, "
+              f"shared-capable RssFile {status['RssFile']} kB)")
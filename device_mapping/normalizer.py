@@ -0,0 +1,203 @@
+"""
+Canonical normalization of device strings and the normalized-key index.
+
+A Normalizer is an ordered pipeline of str -> str steps. It runs once over
+every alias key when the snapshot is compiled and again over each query that
+has no exact match, so both sides are compared in the same canonical form.
+
+Run `python normalizer.py` to print the full collision report for the
+current data files.
+"""
+import re
+import sys
+import json
+import os
+import unicodedata
+
+# Characters that look like ASCII letters or punctuation but are not (applied after casefold).
+_LOOKALIKES = str.maketrans({
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'е': 'e', 'і': 'i', 'ј': 'j', 'к': 'k', 'м': 'm', 'н': 'h',
+    'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x',
+    # Greek
+    'α': 'a', 'ε': 'e', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'χ': 'x',
+    # Dashes, quotes and marks
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-', '−': '-',
+    '‘': "'", '’': "'", '“': '"', '”': '"',
+    '™': None, '®': None, '©': None,
+})
+_SEPARATORS = re.compile(r"[\s\-_/()\[\]]+")
+# A bracketed year may be attached ("a5(2017)"); bare tags need a separator before them ("a52 5g").
+_RELEASE_SUFFIX = re.compile(
+    r"(?:[\s\-_/]*\(\s*(?:19|20)\d{2}\s*\)|[\s\-_/]+(?:(?:19|20)\d{2}|5g|4g|lte))+\s*$")
+
+
+def fold_unicode(text):
+    """NFKC-normalizes, casefolds and maps look-alike characters to ASCII."""
+    return unicodedata.normalize('NFKC', text).casefold().translate(_LOOKALIKES).strip()
+
+
+def drop_release_suffixes(text):
+    """Removes trailing network and year tags such as '5G', 'LTE' or '(2023)'."""
+    stripped = _RELEASE_SUFFIX.sub('', text)
+    return stripped or text
+
+
+def strip_separators(text):
+    """Removes whitespace, hyphens, underscores, slashes and brackets, so 'SM-S908U' == 'sm s908u'."""
+    return _SEPARATORS.sub('', text)
+
+
+DEFAULT_STEPS = (fold_unicode, strip_separators)
+RELAXED_STEPS = (fold_unicode, drop_release_suffixes, strip_separators)
+
+
+class Normalizer:
+    """
+    Pipeline of normalization steps. `steps` produce the canonical key;
+    `relaxed_steps` produce a looser second key that is only used when the
+    canonical key has no match.
+    """
+
+    def __init__(self, steps=DEFAULT_STEPS, relaxed_steps=RELAXED_STEPS):
+        self.steps = tuple(steps)
+        self.relaxed_steps = tuple(relaxed_steps)
+
+    @staticmethod
+    def _apply(steps, text):
+        for step in steps:
+            text = step(text)
+        return text
+
+    def normalize(self, text):
+        return self._apply(self.steps, text)
+
+    def relaxed(self, text):
+        return self._apply(self.relaxed_steps, text)
+
+    def variants(self, text):
+        """Yields the canonical key, then the relaxed key if it differs."""
+        canonical = self.normalize(text)
+        if canonical:
+            yield canonical
+        relaxed = self.relaxed(text) if self.relaxed_steps else canonical
+        if relaxed and relaxed != canonical:
+            yield relaxed
+
+
+def _preference(claim):
+    # On collision a model beats a name, then an alias already in normalized form,
+    # then the shorter and alphabetically first alias key.
+    normalized_key, alias_key, alias_type = claim[:3]
+    return alias_type != "model", alias_key != normalized_key, len(alias_key), alias_key
+
+
+def build_normalized_keys(search_aliases, normalizer=None):
+    """
+    Normalizes every alias key of search_aliases. Returns (keys, collisions): keys maps each
+    normalized key to (alias_key, relaxed), and collisions lists every normalized key that more
+    than one distinct alias target produced. Canonical keys always win over relaxed keys;
+    canonical collisions keep the preferred alias, ambiguous relaxed keys are left out.
+    """
+    normalizer = normalizer or Normalizer()
+    keys = {}
+    collisions = []
+    forms = (("canonical", normalizer.normalize), ("relaxed", normalizer.relaxed))
+    for level, form in forms:
+        if level == "relaxed" and not normalizer.relaxed_steps:
+            break
+        claimed = {}
+        for alias_key, (alias_type, original_key) in search_aliases.items():
+            normalized_key = form(alias_key)
+            if not normalized_key or normalized_key in keys:
+                continue
+            claimed.setdefault(normalized_key, []).append((normalized_key, alias_key, alias_type, original_key))
+        for normalized_key, claims in claimed.items():
+            claims.sort(key=_preference)
+            kept = claims[0]
+            dropped = [claim[1] for claim in claims[1:] if claim[2:] != kept[2:]]
+            # A relaxed key shared by different devices (e.g. two release years) is ambiguous,
+            # so it is reported but not indexed.
+            ambiguous = bool(dropped) and level == "relaxed"
+            if not ambiguous:
+                keys[normalized_key] = (kept[1], level == "relaxed")
+            if dropped:
+                collisions.append({
+                    'normalized': normalized_key,
+                    'level': level,
+                    'kept': None if ambiguous else kept[1],
+                    'dropped': sorted(dropped) if not ambiguous else sorted(claim[1] for claim in claims),
+                })
+    collisions.sort(key=lambda collision: (collision['level'], collision['normalized']))
+    return keys, collisions
+
+
+class NormalizedKeyIndex:
+    """
+    Maps normalized keys back to the original alias keys of search_aliases.
+    keys maps normalized_key -> (alias_key, relaxed): the dict from build_normalized_keys(),
+    or the table compiled into the snapshot, which is never modified. Aliases added or
+    removed by delta updates go to a small overlay on top of it.
+    """
+
+    def __init__(self, keys, normalizer=None):
+        self.normalizer = normalizer or Normalizer()
+        self._keys = keys
+        # normalized_key -> (alias_key, relaxed), or None once removed; entries here override _keys
+        self._changed = {}
+
+    @classmethod
+    def build(cls, search_aliases, normalizer=None):
+        """Normalizes every alias of search_aliases; the collisions are not kept."""
+        normalizer = normalizer or Normalizer()
+        return cls(build_normalized_keys(search_aliases, normalizer)[0], normalizer)
+
+    def _get(self, normalized_key):
+        if normalized_key in self._changed:
+            return self._changed[normalized_key]
+        return self._keys.get(normalized_key)
+
+    def add(self, alias_key):
+        """
+        Indexes an alias added after the build. Like at build time a canonical key replaces
+        a relaxed one; otherwise normalized keys already taken are kept.
+        """
+        for relaxed, form in ((False, self.normalizer.normalize), (True, self.normalizer.relaxed)):
+            if relaxed and not self.normalizer.relaxed_steps:
+                break
+            normalized_key = form(alias_key)
+            if not normalized_key:
+                continue
+            existing = self._get(normalized_key)
+            if existing is None or (existing[1] and not relaxed):
+                self._changed[normalized_key] = (alias_key, relaxed)
+
+    def discard(self, alias_key):
+        """Drops the normalized keys that point to a removed alias."""
+        for normalized_key in {self.normalizer.normalize(alias_key), self.normalizer.relaxed(alias_key)}:
+            entry = self._get(normalized_key)
+            if entry is not None and entry[0] == alias_key:
+                self._changed[normalized_key] = None
+
+    def get(self, query_text):
+        """
+        Returns (alias_key, relaxed) for query_text's normalized forms, or None. relaxed is set
+        when the match needed release tags dropped from the query or the alias: "A5 (2017)"
+        and "A5" meet there, but may well be different devices.
+        """
+        canonical = self.normalizer.normalize(query_text)
+        entry = self._get(canonical) if canonical else None
+        if entry is None and self.normalizer.relaxed_steps:
+            relaxed = self.normalizer.relaxed(query_text)
+            entry = self._get(relaxed) if relaxed and relaxed != canonical else None
+            if entry is not None:
+                entry = entry[0], True
+        return entry
+
+
+if __name__ == '__main__':
+    from lookup_tables import load_tables
+
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    keys, collisions = build_normalized_keys(load_tables(data_dir)[0])
+    print(json.dumps({'normalized_keys': len(keys), 'collisions': collisions}, indent=2, ensure_ascii=False))
@@ -0,0 +1,92 @@
+"""
+Opt-in sampling profiler for individual slow requests.
+
+A request is registered when it starts and unregistered when it ends. A
+background thread wakes every interval and, for each request that has been
+running longer than the threshold, records the current stack of the thread
+serving it. Fast requests are never sampled, so the cost on them is one
+dict insert and one delete. When a sampled request ends, its stacks are
+written in the "folded" format read by flamegraph.pl and speedscope:
+
+    app.py:batch_lookup;device_index.py:iter_batch;... 42
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of requests running longer than threshold_ms, every interval_ms."""
+
+    def __init__(self, threshold_ms, output_dir, interval_ms=5, max_depth=64):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        # token -> [thread_id, started, label, Counter of folded stacks]
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def begin(self, label):
+        """Starts tracking the current thread's request and returns a token for end()."""
+        if self._sampler is None:
+            with self._lock:
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name='slow-request-profiler',
+                                                     daemon=True)
+                    self._sampler.start()
+        token = object()
+        with self._lock:
+            self._active[token] = [threading.get_ident(), time.perf_counter(), label, None]
+        return token
+
+    def end(self, token):
+        """Stops tracking a request. Returns the path of its profile if it was sampled, otherwise None."""
+        with self._lock:
+            _, started, label, stacks = self._active.pop(token, (None, 0, None, None))
+        if not stacks:
+            return None
+        return self._write(label, time.perf_counter() - started, stacks)
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            if not any(now - entry[1] >= self.threshold for entry in list(self._active.values())):
+                continue
+            frames = sys._current_frames()
+            # Samples are added under the lock, so end() never sees a profile still being written to.
+            with self._lock:
+                for entry in self._active.values():
+                    frame = frames.get(entry[0])
+                    if now - entry[1] < self.threshold or frame is None or entry[0] == own_ident:
+                        continue
+                    if entry[3] is None:
+                        entry[3] = Counter()
+                    entry[3][self._fold(frame)] += 1
+            del frames
+
+    def _fold(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _write(self, label, seconds, stacks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = ''.join(char if char.isalnum() else '_' for char in label).strip('_') or 'request'
+        filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{safe_label}-{int(seconds * 1000)}ms.folded"
+        path = os.path.join(self.output_dir, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Slow request {label} took {seconds * 1000:.0f} ms; "
+              f"{sum(stacks.values())} stack samples written to {path}")
+        return path
@@ -0,0 +1,69 @@
+"""
+Bounded LRU caches whose entries belong to one version of the lookup tables.
+
+Every get/put names the data version it was computed against. The first
+access with a newer version empties the cache, so a reload or a delta
+update invalidates everything cached before it without any bookkeeping
+at the places that change the tables.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache holding at most max_entries values and, if max_bytes is set,
+    at most max_bytes of bytes values in total.
+    """
+
+    def __init__(self, max_entries, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _switch_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, version, key):
+        """Returns the value cached for key under version, or None."""
+        with self._lock:
+            self._switch_version(version)
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, version, key, value):
+        """Caches value for key, unless another version has been seen since the matching get()."""
+        size = len(value) if self.max_bytes is not None else 0
+        if self.max_entries <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+            return
+        with self._lock:
+            # Callers get() before they compute and put(); a different version here means
+            # the tables changed in between, so the value may already be stale.
+            if version != self._version:
+                return
+            old_value = self._entries.pop(key, None)
+            if old_value is not None and self.max_bytes is not None:
+                self._bytes -= len(old_value)
+            self._entries[key] = value
+            self._bytes += size
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                if self.max_bytes is not None:
+                    self._bytes -= len(evicted)
@@ -0,0 +1,270 @@
+import re
+import heapq
+from array import array
+from bisect import bisect_left
+
+_TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+_NGRAM = 3
+# Longest suggestion list served from the precomputed per-prefix lists
+TOP_K = 100
+# Prefixes matching more entries than this keep a precomputed top-k list; smaller ranges are ranked on demand.
+_CACHED_RANGE_MIN = 256
+
+
+def _prefix_range(sorted_keys, prefix):
+    """Returns the [start, end) slice of sorted_keys whose entries start with prefix."""
+    start = bisect_left(sorted_keys, prefix)
+    end = bisect_left(sorted_keys, prefix + "\U0010ffff", start)
+    return start, end
+
+
+def _top_k_lists(sorted_keys, ids, rank):
+    """
+    The per-node top-k lists of a prefix trie, kept over a sorted key array instead of
+    trie nodes: every prefix whose range holds more than _CACHED_RANGE_MIN entries
+    gets its TOP_K best ids, so a short prefix never ranks its whole range.
+    Returns {prefix: ids best first}.
+    """
+    top_lists = {}
+
+    def build(start, end, depth):
+        """Caches the lists for the large ranges inside [start, end), whose keys share depth chars; returns its top-k."""
+        candidates = []
+        position = start
+        # Keys that are exactly the shared prefix sort first.
+        while position < end and len(sorted_keys[position]) == depth:
+            candidates.append(ids[position])
+            position += 1
+        while position < end:
+            child_end = bisect_left(sorted_keys, sorted_keys[position][:depth + 1] + "\U0010ffff", position, end)
+            if child_end - position > _CACHED_RANGE_MIN:
+                candidates.extend(build(position, child_end, depth + 1))
+            else:
+                candidates.extend(ids[position:child_end])
+            position = child_end
+        top = heapq.nsmallest(TOP_K, dict.fromkeys(candidates), key=rank.__getitem__)
+        if depth:
+            top_lists[sorted_keys[start][:depth]] = top
+        return top
+
+    if len(sorted_keys) > _CACHED_RANGE_MIN:
+        build(0, len(sorted_keys), 0)
+    return top_lists
+
+
+class _TopKPrefixes:
+    """Ranked prefix ranges of a sorted key array, served from the lists of _top_k_lists() where they exist."""
+
+    def __init__(self, sorted_keys, ids, rank, top_lists):
+        self._keys = sorted_keys
+        self._ids = ids
+        self._rank = rank
+        self._top = top_lists
+
+    def ranked(self, prefix):
+        """Yields the ids of the keys starting with prefix, best rank first."""
+        start, end = _prefix_range(self._keys, prefix)
+        top = self._top.get(prefix) if end - start > _CACHED_RANGE_MIN else None
+        if top is None:
+            yield from sorted(dict.fromkeys(self._ids[start:end]), key=self._rank.__getitem__)
+            return
+        yield from top
+        # Only reached when the caller filtered out most of the cached list.
+        rest = set(self._ids[start:end]).difference(top)
+        yield from sorted(rest, key=self._rank.__getitem__)
+
+
+def suggestion_weights(search_aliases, alias_weights):
+    """
+    Returns (suggestions, weights): the original string of every alias, and for each one the
+    highest device count among the aliases pointing at it.
+    """
+    suggestions = set()
+    weights = {}
+    for alias_key, (_, original_key) in search_aliases.items():
+        suggestions.add(original_key)
+        weight = alias_weights.get(alias_key)
+        if weight and weight > weights.get(original_key, 0):
+            weights[original_key] = weight
+    return suggestions, weights
+
+
+def build_suggestion_tables(suggestions, weights=None):
+    """
+    Computes everything a SuggestionIndex searches. Returns a dict of:
+    strings (sorted by lowercase form), lowered, weights, ranks (position of each string in
+    the ranking), token_keys/token_ids (word tokens that don't start their string, sorted),
+    grams ({trigram: ids}) and top_prefixes/top_tokens (the _top_k_lists() of both key arrays).
+    The snapshot stores these tables, so workers don't compute them (interned_tables.py).
+    """
+    weights = weights or {}
+    strings = sorted(set(suggestions), key=lambda s: (s.lower(), s))
+    lowered = [s.lower() for s in strings]
+    string_weights = [weights.get(s, 0) for s in strings]
+    order = sorted(range(len(strings)), key=lambda string_id: (-string_weights[string_id], len(lowered[string_id]),
+                                                               lowered[string_id]))
+    ranks = array('I', bytes(4 * len(order)))
+    for position, string_id in enumerate(order):
+        ranks[string_id] = position
+
+    # Whole strings are already sorted by their lowercase form, so the
+    # position in strings doubles as the prefix key order.
+    tokens = []
+    grams = {}
+    for string_id, lowered_string in enumerate(lowered):
+        for token in set(_TOKEN_SPLIT.split(lowered_string)):
+            if token and not lowered_string.startswith(token):
+                tokens.append((token, string_id))
+        for gram in {lowered_string[i:i + _NGRAM] for i in range(len(lowered_string) - _NGRAM + 1)}:
+            postings = grams.get(gram)
+            if postings is None:
+                postings = grams[gram] = array('I')
+            postings.append(string_id)
+    tokens.sort()
+    token_keys = [token for token, _ in tokens]
+    token_ids = array('I', (string_id for _, string_id in tokens))
+    return {
+        'strings': strings, 'lowered': lowered, 'weights': string_weights, 'ranks': ranks,
+        'token_keys': token_keys, 'token_ids': token_ids, 'grams': grams,
+        'top_prefixes': _top_k_lists(lowered, range(len(strings)), ranks),
+        'top_tokens': _top_k_lists(token_keys, token_ids, ranks),
+    }
+
+
+class SuggestionIndex:
+    """
+    Completion index over the autocomplete strings.
+
+    Matches are ranked in tiers: whole-string prefix, then word prefix,
+    then any substring. Inside a tier the most common devices (by weight)
+    come first, then shorter strings.
+    The tables come from build_suggestion_tables(), either as built or as compiled
+    into the snapshot, and are never modified. Strings added after the build (delta
+    updates) are kept in a small overflow list that is scanned linearly; removed
+    ones are filtered out. Iterating the index yields the current strings.
+    """
+
+    def __init__(self, tables):
+        self._strings = tables['strings']
+        self._lowered = tables['lowered']
+        self._weights = tables['weights']
+        self._rank = tables['ranks']
+        self._grams = tables['grams']
+        self._base_count = len(self._strings)
+        # Ids from _base_count on are strings added after the build.
+        self._added_strings = []
+        self._added_lowered = []
+        self._added_weights = []
+        self._removed = set()
+        self._top_prefixes = _TopKPrefixes(self._lowered, range(self._base_count), self._rank, tables['top_prefixes'])
+        self._top_tokens = _TopKPrefixes(tables['token_keys'], tables['token_ids'], self._rank, tables['top_tokens'])
+
+    @classmethod
+    def build(cls, suggestions, weights=None):
+        return cls(build_suggestion_tables(suggestions, weights))
+
+    def _string(self, string_id):
+        if string_id < self._base_count:
+            return self._strings[string_id]
+        return self._added_strings[string_id - self._base_count]
+
+    def _lowered_at(self, string_id):
+        if string_id < self._base_count:
+            return self._lowered[string_id]
+        return self._added_lowered[string_id - self._base_count]
+
+    def _rank_key(self, string_id):
+        weight = (self._weights[string_id] if string_id < self._base_count
+                  else self._added_weights[string_id - self._base_count])
+        lowered = self._lowered_at(string_id)
+        return -weight, len(lowered), lowered
+
+    def __len__(self):
+        return self._base_count + len(self._added_strings) - len(self._removed)
+
+    def __iter__(self):
+        removed = self._removed
+        for string_id in range(self._base_count + len(self._added_strings)):
+            string = self._string(string_id)
+            if string not in removed:
+                yield string
+
+    def __contains__(self, string):
+        if string in self._removed:
+            return False
+        lowered = string.lower()
+        index = bisect_left(self._lowered, lowered)
+        while index < self._base_count and self._lowered[index] == lowered:
+            if self._strings[index] == string:
+                return True
+            index += 1
+        return string in self._added_strings
+
+    def add(self, string, weight=0):
+        if string in self._removed:
+            self._removed.discard(string)
+        elif string not in self:
+            # Lowered and weight first: readers only look at ids below the length of _added_strings.
+            self._added_lowered.append(string.lower())
+            self._added_weights.append(weight)
+            self._added_strings.append(string)
+
+    def discard(self, string):
+        if string in self:
+            self._removed.add(string)
+
+    def _prefix_matches(self, query):
+        return self._top_prefixes.ranked(query)
+
+    def _token_matches(self, query):
+        return self._top_tokens.ranked(query)
+
+    def _substring_matches(self, query):
+        if len(query) < _NGRAM:
+            return ()
+        postings = []
+        for i in range(len(query) - _NGRAM + 1):
+            gram_postings = self._grams.get(query[i:i + _NGRAM])
+            if gram_postings is None:
+                return ()
+            postings.append(gram_postings)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for gram_postings in postings[1:]:
+            candidates.intersection_update(gram_postings)
+            if not candidates:
+                return ()
+        lowered = self._lowered
+        return sorted((string_id for string_id in candidates if query in lowered[string_id]),
+                      key=self._rank.__getitem__)
+
+    def search(self, query, limit=20):
+        """Returns up to `limit` suggestions matching `query`, best first."""
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+        removed = self._removed
+        added_ids = range(self._base_count, self._base_count + len(self._added_strings))
+        tiers = (
+            (self._prefix_matches, lambda text: text.startswith(query)),
+            (self._token_matches, lambda text: any(token.startswith(query) for token in _TOKEN_SPLIT.split(text))),
+            (self._substring_matches, lambda text: query in text),
+        )
+        for tier_matches, overflow_match in tiers:
+            # Each tier yields its matches best first, so only the first few are ever ranked.
+            overflow = sorted((string_id for string_id in added_ids if overflow_match(self._lowered_at(string_id))),
+                              key=self._rank_key)
+            for string_id in heapq.merge(tier_matches(query), overflow, key=self._rank_key):
+                if string_id in seen:
+                    continue
+                string = self._string(string_id)
+                if string in removed:
+                    continue
+                seen.add(string_id)
+                results.append(string)
+                if len(results) >= limit:
+                    return results
+        return results
@@ -0,0 +1,41 @@
+"""
+Checks that batch_lookup.py writes only results to stdout, so its output can be
+redirected straight into a file (python -m pytest test_batch_lookup.py).
+"""
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+QUERIES = "Galaxy S21\nSM-G991B\niPhone 13\nno such device\n"
+
+
+def _fresh_copy(tmp_path):
+    # Without a snapshot the load parses the text sources and reports it, which must not reach stdout.
+    data_dir = tmp_path / 'device_mapping'
+    shutil.copytree(BASE_PATH, data_dir,
+                    ignore=shutil.ignore_patterns('lookup_tables.snapshot', '__pycache__', 'profiles'))
+    return data_dir
+
+
+def _run_batch(data_dir, *args):
+    return subprocess.run([sys.executable, str(data_dir / 'batch_lookup.py'), '-', *args, '--workers', '1'],
+                          input=QUERIES, capture_output=True, text=True, encoding='utf-8', check=True)
+
+
+def test_ndjson_stdout_holds_only_results(tmp_path):
+    result = _run_batch(_fresh_copy(tmp_path), '--format', 'ndjson')
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [row['input'] for row in rows[:-1]] == QUERIES.splitlines()
+    assert set(rows[-1]) == {'found_models', 'found_names'}
+    assert "missing or stale" in result.stderr
+
+
+def test_csv_stdout_holds_only_results(tmp_path):
+    result = _run_batch(_fresh_copy(tmp_path), '--format', 'csv')
+    lines = result.stdout.splitlines()
+    assert lines[0] == 'input,status,items'
+    assert len(lines) == 1 + len(QUERIES.splitlines())
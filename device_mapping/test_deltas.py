@@ -0,0 +1,59 @@
+"""
+Checks that deltas follow the load's precedence rules and that a malformed delta file
+leaves the live tables and the file watcher running (python -m pytest test_deltas.py).
+"""
+import os
+import sys
+import shutil
+import subprocess
+
+from deltas import apply_delta_ops
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter inside the copy, so app.py serves the copy's data files.
+_PROBE = """
+import os, sys, time
+sys.path.insert(0, os.getcwd())
+import app
+
+def lookup(query):
+    return app.app.test_client().get('/lookup', query_string={'query': query, 'type': 'name'}).get_json()
+
+watcher = app.start_data_watcher(0.05)
+os.makedirs('deltas', exist_ok=True)
+with open(os.path.join('deltas', '001.delta'), 'wb') as f:
+    f.write(b'{"op": "add_model", "name": "Galaxy S99", "model": "SM-Z999X"}\\n{"op": "add_alias", "alias": "\\xff"}\\n')
+time.sleep(0.5)
+assert watcher.is_alive()
+assert lookup('SM-G991B')['status'] == 'success'
+assert lookup('SM-Z999X')['status'] != 'success'
+response = app.app.test_client().post('/admin/apply_deltas', headers={'X-Admin-Token': 'test'})
+assert response.status_code == 500 and response.get_json()['status'] == 'error', response.status_code
+
+# Once the file is fixed the watcher picks it up.
+with open(os.path.join('deltas', '001.delta'), 'wb') as f:
+    f.write(b'{"op": "add_model", "name": "Galaxy S99", "model": "SM-Z999X"}\\n')
+time.sleep(0.5)
+assert watcher.is_alive()
+assert lookup('SM-Z999X')['items'] == ['Galaxy S99'], lookup('SM-Z999X')
+print('ok')
+"""
+
+
+def test_malformed_delta_keeps_tables_and_watcher(tmp_path):
+    data_dir = tmp_path / 'device_mapping'
+    shutil.copytree(BASE_PATH, data_dir, ignore=shutil.ignore_patterns('__pycache__', 'profiles', 'deltas'))
+    result = subprocess.run([sys.executable, '-c', _PROBE], cwd=data_dir, capture_output=True, text=True,
+                            encoding='utf-8', env=dict(os.environ, DEVICE_MAPPING_ADMIN_TOKEN='test'))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == 'ok'
+    assert "001.delta:2" in result.stdout
+
+
+def test_add_model_name_replaces_model_alias():
+    # As in mapping_devices.txt, a canonical name that is also another device's model code wins.
+    search_aliases = {'sm-g991b': ("model", "SM-G991B")}
+    apply_delta_ops(search_aliases, {}, {}, [{'op': 'add_model', 'name': "SM-G991B", 'model': "ZZ-1"},
+                                             {'op': 'add_alias', 'alias': "zz-1", 'name': "Other"}])
+    assert search_aliases == {'sm-g991b': ("name", "SM-G991B"), 'zz-1': ("model", "ZZ-1")}
@@ -0,0 +1,79 @@
+"""
+Structured report of the problems found while parsing the data files.
+
+parse_sources() settles conflicts between the files by fixed precedence
+rules (a model alias beats a name alias, a later name alias replaces an
+earlier one). Given a ValidationReport it also records every such decision,
+every duplicate and every malformed row, each with its file and row:
+
+    errors      rows that can't be parsed; the compile step fails on them
+    warnings    rows that are skipped or partly ignored
+    conflicts   aliases settled by precedence, models with several names,
+                aliases that share a normalized key (normalizer.py)
+    duplicates  rows that repeat an earlier row and are merged into it
+
+`python lookup_tables.py --check --report report.json` writes the report
+without building the snapshot.
+"""
+from collections import Counter
+
+# How many examples of each kind the printed summary shows
+SUMMARY_EXAMPLES = 3
+
+
+class DataError(ValueError):
+    """A data file has a row that can't be parsed."""
+
+
+class ValidationReport:
+    """Collects row-level diagnostics; every entry is a dict with kind, location and message."""
+
+    CATEGORIES = ('errors', 'warnings', 'conflicts', 'duplicates')
+
+    def __init__(self):
+        for category in self.CATEGORIES:
+            setattr(self, category, [])
+
+    def _add(self, category, kind, location, message, details):
+        getattr(self, category).append(dict(details, kind=kind, location=location, message=message))
+
+    def error(self, kind, location, message, **details):
+        self._add('errors', kind, location, message, details)
+
+    def warning(self, kind, location, message, **details):
+        self._add('warnings', kind, location, message, details)
+
+    def conflict(self, kind, location, message, **details):
+        self._add('conflicts', kind, location, message, details)
+
+    def duplicate(self, kind, location, message, **details):
+        self._add('duplicates', kind, location, message, details)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def counts(self):
+        """{category: {kind: count}}."""
+        return {category: dict(Counter(entry['kind'] for entry in getattr(self, category)))
+                for category in self.CATEGORIES}
+
+    def to_dict(self):
+        report = {'ok': self.ok, 'counts': self.counts()}
+        report.update((category, getattr(self, category)) for category in self.CATEGORIES)
+        return report
+
+    def summary(self, examples=SUMMARY_EXAMPLES):
+        """A short text summary: counts per kind with the first few rows of each."""
+        lines = []
+        for category in self.CATEGORIES:
+            entries = getattr(self, category)
+            lines.append(f"{category.capitalize()}: {len(entries)}")
+            shown = Counter()
+            for kind, count in sorted(Counter(entry['kind'] for entry in entries).items()):
+                lines.append(f"  {kind}: {count}")
+                for entry in entries:
+                    if entry['kind'] == kind and shown[kind] < examples:
+                        shown[kind] += 1
+                        lines.append(f"    {entry['location']}: {entry['message']}")
+        return "\n".join(lines)